@@ -0,0 +1,744 @@
+# bench.py — локальные бенчмарки без обращения к реальным площадкам
+#
+#   python bench.py fetch [--delay 0.2] [--items 50]
+#   python bench.py cache [--delay 0.2] [--items 50] [--no-etag]
+#   python bench.py match [--keywords 10000] [--tenders 5000]
+#   python bench.py deliver [--users 200] [--matches 15] [--flood 0.01]
+#   python bench.py search [--rows 1000000] [--queries 200]
+#   python bench.py parse [--pages 64] [--items 200] [--workers 4]
+#   python bench.py stream [--items 200000] [--limit 50]
+#   python bench.py fixtures [--live] [--items 50]
+#   python bench.py pipeline [--scales 1000,10000,100000] [--out bench_results.json]
+#   python bench.py compare OLD.json NEW.json
+#   python bench.py webhook [--updates 2000] [--connections 40] [--in-flight 1,64]
+import os
+import re
+import sys
+import time
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+from urllib.parse import urlparse
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from config import SITES
+
+BENCH_PORT = 18080
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+# --- Генерация страниц ---
+def make_page(site_type, items, seed=0):
+    rnd = random.Random(seed)
+    words = ["трубы", "кабель", "ремонт", "услуги", "поставка", "бетон", "охрана", "связь", "қызмет", "жөндеу"]
+
+    def title(i):
+        return f"{rnd.choice(words).capitalize()} {rnd.choice(words)} №{i}"
+
+    if site_type == "json":
+        return json.dumps([
+            {"id": f"{seed}-{i}", "title": title(i), "ref_customer_name_ru": f"ТОО Заказчик {i}",
+             "amount": rnd.randint(10_000, 10_000_000), "date": "2024-01-01"}
+            for i in range(items)
+        ], ensure_ascii=False)
+    if site_type == "xml":
+        rows = "".join(
+            f"<tender><id>{seed}-{i}</id><title>{title(i)}</title><customer>ГУ {i}</customer>"
+            f"<amount>{rnd.randint(10_000, 10_000_000)}</amount><date>2024-01-01</date></tender>"
+            for i in range(items)
+        )
+        return f"<?xml version=\"1.0\" encoding=\"utf-8\"?><tenders>{rows}</tenders>"
+    if site_type == "rss":
+        rows = "".join(
+            f"<item><title>{title(i)}</title><link>https://example.kz/{seed}/{i}</link>"
+            f"<pubDate>Mon, 01 Jan 2024 00:00:00 GMT</pubDate></item>"
+            for i in range(items)
+        )
+        return f"<?xml version=\"1.0\" encoding=\"utf-8\"?><rss><channel>{rows}</channel></rss>"
+    rows = "".join(
+        f"<div class=\"tender-item tender-row\"><a href=\"/t/{seed}/{i}\">{title(i)}</a></div>"
+        for i in range(items)
+    )
+    return f"<html><body>{rows}</body></html>"
+
+
+# --- Локальный стенд вместо площадок ---
+async def start_standin(delay, items, port=BENCH_PORT, etag=True, pages=None):
+    # pages — {индекс площадки: тело страницы}; по умолчанию синтетические страницы
+    if pages is None:
+        pages = {idx: make_page(site["type"], items, seed=idx).encode("utf-8") for idx, site in enumerate(SITES)}
+
+    async def handle(request):
+        idx = int(request.match_info["idx"])
+        await asyncio.sleep(delay)
+        tag = '"%s"' % hashlib.md5(pages[idx]).hexdigest()
+        if etag and request.headers.get("If-None-Match") == tag:
+            return web.Response(status=304)
+        content_type = "application/json" if SITES[idx]["type"] == "json" else "text/html"
+        headers = {"ETag": tag} if etag else {}
+        return web.Response(body=pages[idx], content_type=content_type, charset="utf-8", headers=headers)
+
+    app = web.Application()
+    app.router.add_get("/site/{idx}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    # каждая площадка живёт на своём loopback-адресе, чтобы лимит на хост работал как в проде
+    for idx in range(len(SITES)):
+        await web.TCPSite(runner, f"127.0.0.{idx + 1}", port).start()
+
+    sites = []
+    for idx, site in enumerate(SITES):
+        local = dict(site)
+        if site.get("url"):
+            local["url"] = f"http://127.0.0.{idx + 1}:{port}/site/{idx}"
+        sites.append(local)
+    return runner, sites
+
+
+def isolate_cache():
+    # бенчмарк не должен трогать боевой http_cache.json
+    import http_cache
+    http_cache.CACHE_PATH = os.path.join(tempfile.mkdtemp(), "http_cache.json")
+    http_cache.reset()
+
+
+# --- fetch: последовательный путь против асинхронного ---
+async def bench_fetch(args):
+    import tender_parser
+    import fetcher
+
+    isolate_cache()
+    runner, sites = await start_standin(args.delay, args.items)
+    loop = asyncio.get_running_loop()
+    try:
+        started = time.perf_counter()
+        seq = await loop.run_in_executor(None, tender_parser.fetch_tenders, args.items, sites)
+        seq_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        conc = await fetcher.fetch_tenders_async(args.items, sites)
+        conc_time = time.perf_counter() - started
+    finally:
+        await fetcher.close_session()
+        await runner.cleanup()
+
+    print(f"sequential: {len(seq)} tenders in {seq_time:.2f}s")
+    print(f"concurrent: {len(conc)} tenders in {conc_time:.2f}s")
+    print(f"speedup:    x{seq_time / conc_time:.1f}")
+
+
+# --- cache: повторный цикл по неизменившимся страницам ---
+async def bench_cache(args):
+    import db
+    import fetcher
+    import sync_state
+
+    isolate_cache()
+    isolate_db()
+    runner, sites = await start_standin(args.delay, args.items, etag=not args.no_etag)
+    try:
+        for cycle in ("cold", "warm"):
+            started = time.perf_counter()
+            results = await fetcher.fetch_sites(args.items, sites)
+            # ETag/хэши запоминаются только вместе с сохранёнными тендерами
+            db.save_new_tenders(fetcher.collect(results))
+            sync_state.commit()
+            elapsed = time.perf_counter() - started
+            parsed = sum(len(r["tenders"]) for r in results)
+            unchanged = sum(r["unchanged"] for r in results)
+            print(f"{cycle}: {elapsed:.2f}s, parsed {parsed} tenders, {unchanged}/{len(results)} sites unchanged")
+    finally:
+        await fetcher.close_session()
+        await runner.cleanup()
+
+
+# --- match: вложенный цикл против автомата Ахо–Корасик ---
+def random_words(rnd, count, min_len=4, max_len=9):
+    alphabet = "абвгдежзийклмнопрстуфхцчшщыэюяәғқңөұүһі"
+    return ["".join(rnd.choice(alphabet) for _ in range(rnd.randint(min_len, max_len))) for _ in range(count)]
+
+
+async def bench_match(args):
+    from matcher import KeywordMatcher
+
+    rnd = random.Random(42)
+    keywords = set(random_words(rnd, args.keywords))
+    vocabulary = random_words(rnd, 2000) + rnd.sample(sorted(keywords), min(len(keywords), 500))
+    names = [" ".join(rnd.choice(vocabulary) for _ in range(rnd.randint(4, 10))) for _ in range(args.tenders)]
+
+    started = time.perf_counter()
+    loop_hits = [{kw for kw in keywords if kw in name} for name in names]
+    loop_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    m = KeywordMatcher(keywords)
+    m.find("")
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ac_hits = [m.find(name) for name in names]
+    ac_time = time.perf_counter() - started
+
+    assert loop_hits == ac_hits, "matcher disagrees with the substring loop"
+    print(f"{len(keywords)} keywords x {len(names)} tenders, {sum(map(len, ac_hits))} matches")
+    print(f"nested loop:  {loop_time:.2f}s")
+    print(f"aho-corasick: {ac_time:.2f}s (+{build_time:.2f}s build)")
+    print(f"speedup:      x{loop_time / ac_time:.1f}")
+
+
+# --- deliver: очередь отправки против фейкового бота ---
+class FakeBot:
+    # имитирует Telegram: задержку ответа, лимит 30 сообщений/с и случайные flood wait
+    def __init__(self, latency=0.02, flood=0.0, rate_limit=True):
+        self.latency = latency
+        self.flood = flood
+        self.rate_limit = rate_limit
+        self.sent = []
+        self.window = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        from aiogram.exceptions import TelegramRetryAfter
+        from aiogram.methods import SendMessage
+
+        await asyncio.sleep(self.latency)
+        if self.rate_limit:
+            now = time.monotonic()
+            self.window = [t for t in self.window if now - t < 1] + [now]
+        if len(self.window) > 30 or random.random() < self.flood:
+            raise TelegramRetryAfter(SendMessage(chat_id=chat_id, text=text), "Flood control exceeded", 1)
+        self.sent.append((chat_id, text))
+
+
+async def bench_deliver(args):
+    from delivery import DeliveryQueue
+
+    rnd = random.Random(7)
+    fake = FakeBot(flood=args.flood)
+    queue = DeliveryQueue(fake)
+    texts = [make_page("json", 1, seed=i)[:300] for i in range(args.matches)]
+    await queue.start()
+    started = time.perf_counter()
+    messages = sum(queue.enqueue(user_id, rnd.sample(texts, rnd.randint(1, len(texts))))
+                   for user_id in range(args.users))
+    await queue.join()
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+    print(f"{args.users} users: {messages} packed messages, {len(fake.sent)} delivered in {elapsed:.2f}s")
+    print(f"rate: {len(fake.sent) / elapsed:.1f} msg/s, stats: {queue.stats}")
+
+
+# --- search: FTS5 по таблице tenders ---
+def isolate_db():
+    # отдельная временная база, чтобы не трогать database.db
+    import storage
+    storage.close_all()
+    storage.DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.db")
+    storage.create_tables()
+
+
+async def bench_search(args):
+    import db
+    import storage
+
+    isolate_db()
+    rnd = random.Random(3)
+    vocabulary = random_words(rnd, 20000)
+    started = time.perf_counter()
+    with storage.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO tenders (purchase_number, name, customer, amount, publish_date, source, inserted_at) "
+            "VALUES (?, ?, ?, ?, '', 'bench', '2024-01-01')",
+            ((str(i), " ".join(rnd.choices(vocabulary, k=6)), " ".join(rnd.choices(vocabulary, k=2)),
+              rnd.randint(1, 10**7)) for i in range(args.rows))
+        )
+    print(f"loaded {args.rows} rows with FTS triggers in {time.perf_counter() - started:.1f}s")
+
+    queries = [" ".join(rnd.sample(vocabulary, rnd.randint(1, 2))) for _ in range(args.queries)]
+    queries += [w[:3] for w in rnd.sample(vocabulary, args.queries)]
+    timings = []
+    for q in queries:
+        started = time.perf_counter()
+        db.search_tenders(q, 10)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f"{len(queries)} queries: p50 {timings[len(timings) // 2] * 1000:.1f}ms, "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:.1f}ms, max {timings[-1] * 1000:.1f}ms")
+
+
+# --- parse: BeautifulSoup против lxml в пуле процессов ---
+def save_corpus(directory, pages, items):
+    # корпус сохранённых страниц: по файлу на страницу, типы по кругу как в SITES
+    corpus = []
+    for i in range(pages):
+        site = SITES[i % len(SITES)]
+        path = os.path.join(directory, f"{i:04d}.{site['type']}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(make_page(site["type"], items, seed=i))
+        corpus.append((site, path))
+    return corpus
+
+
+async def bench_parse(args):
+    from concurrent.futures import ProcessPoolExecutor
+    import parsing
+    import tender_parser
+
+    corpus = []
+    for site, path in save_corpus(tempfile.mkdtemp(), args.pages, args.items):
+        with open(path, "rb") as f:
+            corpus.append((site, f.read()))
+    total_bytes = sum(len(raw) for _, raw in corpus)
+    print(f"corpus: {len(corpus)} pages, {total_bytes / 1e6:.1f} MB")
+
+    started = time.perf_counter()
+    bs4_count = sum(len(tender_parser.parse_site(site, raw.decode("utf-8"), args.items)) for site, raw in corpus)
+    bs4_time = time.perf_counter() - started
+    print(f"bs4, 1 thread:   {len(corpus) / bs4_time:7.1f} pages/s, {bs4_count / bs4_time:9.0f} tenders/s")
+
+    def job(site, raw):
+        return (site["type"], site["selector"], raw, "utf-8", args.items, site["name"])
+
+    started = time.perf_counter()
+    lxml_count = sum(len(parsing.parse_document(*job(site, raw))[0]) for site, raw in corpus)
+    lxml_time = time.perf_counter() - started
+    print(f"lxml, 1 core:    {len(corpus) / lxml_time:7.1f} pages/s, {lxml_count / lxml_time:9.0f} tenders/s")
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        await asyncio.gather(*(loop.run_in_executor(pool, parsing.parse_document, *job(s, r)) for s, r in corpus[:args.workers]))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(loop.run_in_executor(pool, parsing.parse_document, *job(s, r)) for s, r in corpus))
+        pool_time = time.perf_counter() - started
+    pool_count = sum(len(rows) for rows, _ in results)
+    print(f"lxml, {args.workers} workers: {len(corpus) / pool_time:7.1f} pages/s, {pool_count / pool_time:9.0f} tenders/s "
+          f"({pool_count / pool_time / args.workers:.0f} tenders/s per core)")
+    assert bs4_count == lxml_count == pool_count, "parsers disagree on the number of tenders"
+
+
+# --- stream: потоковый разбор больших лент против чтения целиком ---
+async def bench_stream(args):
+    import tracemalloc
+    import fetcher
+    import parsing
+
+    isolate_cache()
+    parsing.PARSE_WORKERS = 0  # разбор в потоке, чтобы tracemalloc видел всю память
+    pages = {t: make_page(t, args.items).encode("utf-8") for t in ("json", "xml", "rss")}
+
+    async def handle(request):
+        site_type = request.match_info["type"]
+        response = web.StreamResponse(headers={"Content-Type": "application/octet-stream"})
+        await response.prepare(request)
+        body = pages[site_type]
+        for i in range(0, len(body), 256 * 1024):
+            await response.write(body[i:i + 256 * 1024])
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/{type}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", BENCH_PORT).start()
+    try:
+        for site_type, body in pages.items():
+            site = {"name": f"bench-{site_type}", "type": site_type, "url": f"http://127.0.0.1:{BENCH_PORT}/{site_type}"}
+            for streaming in (False, True):
+                fetcher.FETCH_STREAMING = streaming
+                tracemalloc.start()
+                result = await fetcher.fetch_site(fetcher.get_session(), site, args.limit)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                first = result.get("first_item", result["elapsed"])
+                print(f"{site_type:4} {len(body) / 1e6:6.1f} MB {'stream' if streaming else 'buffer':6}: "
+                      f"{len(result['tenders'])} tenders, first after {first * 1000:7.1f}ms, "
+                      f"total {result['elapsed'] * 1000:7.1f}ms, peak {peak / 1e6:6.1f} MB")
+    finally:
+        await fetcher.close_session()
+        await runner.cleanup()
+
+
+# --- fixtures: записанные страницы площадок ---
+def fixture_path(site):
+    return os.path.join(FIXTURES_DIR, f"{urlparse(site['url']).hostname}.{site['type']}")
+
+
+async def record_fixtures(args):
+    # --live снимает настоящие страницы площадок, иначе пишет синтетические
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for idx, site in enumerate(SITES):
+        if not site.get("url"):
+            continue
+        if args.live:
+            import requests
+            r = requests.get(site["url"], timeout=30)
+            r.raise_for_status()
+            body = r.content
+        else:
+            body = make_page(site["type"], args.items, seed=idx).encode("utf-8")
+        with open(fixture_path(site), "wb") as f:
+            f.write(body)
+        print(f"{fixture_path(site)}: {len(body)} bytes")
+
+
+def load_fixtures():
+    pages = {}
+    for idx, site in enumerate(SITES):
+        if not site.get("url"):
+            continue
+        path = fixture_path(site)
+        if not os.path.exists(path):
+            sys.exit(f"missing fixture {path}, run: python bench.py fixtures")
+        with open(path, "rb") as f:
+            pages[idx] = f.read()
+    return pages
+
+
+# --- pipeline: полный цикл опрос → сохранение → матчинг → отправка ---
+def fixture_words(pages):
+    # слова из названий тендеров в фикстурах — из них строятся «горячие» подписки
+    import parsing
+
+    words = set()
+    for idx, raw in pages.items():
+        site = SITES[idx]
+        rows, _ = parsing.parse_document(site["type"], site.get("selector"), raw, "utf-8", 10**6, site["name"])
+        for row in rows:
+            words.update(re.findall(r"\w{4,}", (row[1] or "").lower()))
+    return sorted(words)
+
+
+def revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # Linux: KiB
+
+
+@contextmanager
+def measure(stages, name, trace):
+    import tracemalloc
+
+    if trace:
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    yield
+    stages[name] = {"seconds": round(time.perf_counter() - started, 4)}
+    if trace:
+        stages[name]["peak_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+
+
+async def pipeline_run(scale, sites, hot, args):
+    import bot
+    import db
+    import dedup
+    import fetcher
+    import matching
+    import storage
+    import sync_state
+    from delivery import DeliveryQueue
+
+    isolate_db()
+    isolate_cache()
+    dedup.reset()
+    db.TENDER_RETENTION_DAYS = 0  # фикстуры площадок датированы 2024 годом
+    rnd = random.Random(scale)
+    vocabulary = random_words(rnd, scale, 7, 10)  # длинные, чтобы случайно не совпадать с названиями
+    rows = []
+    for user_id in range(scale):
+        keywords = rnd.sample(vocabulary, args.per_user)
+        if rnd.random() < args.hit_rate:
+            keywords[0] = rnd.choice(hot)
+        rows.extend((user_id, kw) for kw in keywords)
+    with storage.transaction() as conn:
+        conn.executemany("INSERT OR IGNORE INTO subscriptions (user_id, keyword) VALUES (?, ?)", rows)
+
+    stub = FakeBot(latency=args.send_latency, rate_limit=False)
+    queue = DeliveryQueue(stub, global_rate=1e9, chat_rate=1e9)
+    await queue.start()
+    stages = {}
+    with measure(stages, "load", args.trace):
+        db.create_tables()
+    with measure(stages, "fetch", args.trace):
+        tenders = fetcher.collect(await fetcher.fetch_sites(args.limit, sites))
+    with measure(stages, "save", args.trace):
+        added = db.save_new_tenders(tenders)
+        sync_state.commit()
+    queued = 0
+    with measure(stages, "match", args.trace):
+        # сопоставление по match_cursor вместе с записью в outbox, как в workers.match_loop
+        while True:
+            processed, count = matching.match_new()
+            queued += count
+            if not processed:
+                break
+    with measure(stages, "notify", args.trace):
+        while await bot.send_outbox_batch(queue):
+            await queue.join()
+        # статусы outbox обновляются в потоках БД уже после доставки
+        while True:
+            with storage.connection() as conn:
+                if not conn.execute("SELECT 1 FROM outbox WHERE status='sending' LIMIT 1").fetchone():
+                    break
+            await asyncio.sleep(0.01)
+    with measure(stages, "quiet_cycle", args.trace):
+        # повторный опрос: страницы не изменились, новых тендеров нет
+        db.save_new_tenders(fetcher.collect(await fetcher.fetch_sites(args.limit, sites)))
+        matching.match_new()
+    await queue.stop()
+
+    result = {
+        "users": scale,
+        "keywords": len(vocabulary),
+        "subscriptions": len(rows),
+        "tenders_fetched": len(tenders),
+        "tenders_new": len(added),
+        "notifications": queued,
+        "messages": len(stub.sent),
+        "stages": stages,
+        "cycle_seconds": round(sum(st["seconds"] for name, st in stages.items() if name not in ("load", "quiet_cycle")), 4),
+        "max_rss_mb": max_rss_mb(),
+    }
+    print(f"{scale:>7} users: " + ", ".join(f"{name} {st['seconds']:.3f}s" for name, st in stages.items())
+          + f"; {len(added)} new, {queued} notifications, {len(stub.sent)} messages, max RSS {result['max_rss_mb']} MB")
+    return result
+
+
+async def bench_pipeline(args):
+    import tracemalloc
+    import fetcher
+
+    os.environ.setdefault("BOT_TOKEN", "1:bench")  # bot.py требует токен при импорте; в Telegram не ходим
+    pages = load_fixtures()
+    hot = fixture_words(pages)
+    runner, sites = await start_standin(args.delay, 0, pages=pages)
+    if args.trace:
+        tracemalloc.start()
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "params": {k: v for k, v in vars(args).items() if k not in ("func", "cmd", "out")},
+        "runs": [],
+    }
+    try:
+        for scale in args.scales:
+            report["runs"].append(await pipeline_run(scale, sites, hot, args))
+    finally:
+        if args.trace:
+            tracemalloc.stop()
+        await fetcher.close_session()
+        await runner.cleanup()
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"results written to {args.out}")
+
+
+async def bench_compare(args):
+    with open(args.old, encoding="utf-8") as f:
+        old = {run["users"]: run for run in json.load(f)["runs"]}
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)["runs"]
+    for run in new:
+        base = old.get(run["users"])
+        if base is None:
+            continue
+        print(f"{run['users']} users:")
+        for name, st in run["stages"].items():
+            was = base["stages"].get(name, {}).get("seconds")
+            if was:
+                print(f"  {name:12} {was:8.3f}s -> {st['seconds']:8.3f}s  x{was / max(st['seconds'], 1e-9):.2f}")
+        print(f"  max RSS      {base.get('max_rss_mb')} MB -> {run.get('max_rss_mb')} MB")
+
+
+# --- webhook: поток обновлений от фейкового Telegram ---
+async def start_fake_telegram(latency, port):
+    # Bot API: отвечает на любой метод, sendMessage запоминает (chat_id, время ответа)
+    replies = {}
+
+    async def handle(request):
+        method = request.match_info["method"].lower()
+        form = await request.post()
+        await asyncio.sleep(latency)
+        if method == "sendmessage":
+            chat_id = int(form["chat_id"])
+            replies[chat_id] = time.perf_counter()
+            result = {"message_id": chat_id, "date": int(time.time()), "text": form.get("text", ""),
+                      "chat": {"id": chat_id, "type": "private"}}
+        elif method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner, replies
+
+
+def make_update(i, text):
+    return {
+        "update_id": i,
+        "message": {
+            "message_id": i,
+            "date": int(time.time()),
+            "chat": {"id": i, "type": "private"},
+            "from": {"id": i, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+async def bench_webhook(args):
+    import aiohttp
+
+    api_port, app_port = BENCH_PORT + 1, BENCH_PORT + 2
+    os.environ.setdefault("BOT_TOKEN", "1:bench")
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{api_port}"
+    os.environ["WEBHOOK_URL"] = f"http://127.0.0.1:{app_port}"
+    isolate_db()
+    import bot
+    await bot.prepare_db()  # без него обработчики ждут готовности БД
+
+    api, replies = await start_fake_telegram(args.api_latency, api_port)
+    commands = ["/start", "/help", "/listkeywords"]
+    url = f"http://127.0.0.1:{app_port}{bot.WEBHOOK_PATH}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": bot.WEBHOOK_SECRET or ""}
+    try:
+        for limit in args.in_flight:
+            bot.WEBHOOK_MAX_IN_FLIGHT = limit
+            app = web.Application()
+            bot.setup_webhook(app)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", app_port).start()
+
+            replies.clear()
+            posted = {}
+            updates = iter(range(args.updates))
+
+            async def poster(session):
+                # как Telegram: не больше connections запросов одновременно
+                for i in updates:
+                    posted[i] = time.perf_counter()
+                    async with session.post(url, json=make_update(i, commands[i % len(commands)]), headers=headers) as resp:
+                        assert resp.status == 200, resp.status
+
+            started = time.perf_counter()
+            async with aiohttp.ClientSession() as session:
+                await asyncio.gather(*(poster(session) for _ in range(args.connections)))
+            while len(replies) < args.updates and time.perf_counter() - started < args.timeout:
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+            latencies = sorted(replies[i] - posted[i] for i in replies)
+            await runner.cleanup()
+            print(f"in-flight {limit:>3}: {len(replies)}/{args.updates} replies in {elapsed:.2f}s, "
+                  f"{len(replies) / elapsed:.0f} updates/s, p50 {latencies[len(latencies) // 2] * 1000:.0f}ms, "
+                  f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f}ms")
+    finally:
+        await bot.bot.session.close()
+        await api.cleanup()
+
+
+def scales(value):
+    return [int(x) for x in value.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TenderuBot benchmarks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("fetch", help="sequential vs concurrent fetch against a local stand-in")
+    p.add_argument("--delay", type=float, default=0.2, help="simulated server latency, seconds")
+    p.add_argument("--items", type=int, default=50)
+    p.set_defaults(func=bench_fetch)
+
+    p = sub.add_parser("cache", help="cold vs warm cycle with the conditional-request cache")
+    p.add_argument("--delay", type=float, default=0.2, help="simulated server latency, seconds")
+    p.add_argument("--items", type=int, default=50)
+    p.add_argument("--no-etag", action="store_true", help="server ignores validators, rely on body hash")
+    p.set_defaults(func=bench_cache)
+
+    p = sub.add_parser("match", help="nested keyword loop vs Aho-Corasick matcher")
+    p.add_argument("--keywords", type=int, default=10000)
+    p.add_argument("--tenders", type=int, default=5000)
+    p.set_defaults(func=bench_match)
+
+    p = sub.add_parser("deliver", help="rate-limited delivery queue against a fake Bot")
+    p.add_argument("--users", type=int, default=200)
+    p.add_argument("--matches", type=int, default=15, help="max matches per user")
+    p.add_argument("--flood", type=float, default=0.01, help="probability of a random flood wait")
+    p.set_defaults(func=bench_deliver)
+
+    p = sub.add_parser("search", help="FTS5 /search latency on a large tenders table")
+    p.add_argument("--rows", type=int, default=1000000)
+    p.add_argument("--queries", type=int, default=200)
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser("parse", help="BeautifulSoup vs lxml process-pool parse throughput")
+    p.add_argument("--pages", type=int, default=64)
+    p.add_argument("--items", type=int, default=200)
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser("stream", help="streaming vs buffered parsing of a large feed")
+    p.add_argument("--items", type=int, default=200000)
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser("fixtures", help="write fixture pages for every site into fixtures/")
+    p.add_argument("--live", action="store_true", help="record the real sites instead of synthetic pages")
+    p.add_argument("--items", type=int, default=50)
+    p.set_defaults(func=record_fixtures)
+
+    p = sub.add_parser("pipeline", help="full poll -> match -> notify cycle on fixtures with a stub Bot")
+    p.add_argument("--scales", type=scales, default=[1000, 10000, 100000], help="comma-separated user/keyword counts")
+    p.add_argument("--per-user", type=int, default=3, help="keywords per user")
+    p.add_argument("--hit-rate", type=float, default=0.01, help="share of users with a keyword found in fixtures")
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--delay", type=float, default=0.0, help="simulated server latency, seconds")
+    p.add_argument("--send-latency", type=float, default=0.0, help="simulated Telegram latency, seconds")
+    p.add_argument("--no-trace", dest="trace", action="store_false", help="skip tracemalloc (faster, no allocation peaks)")
+    p.add_argument("--out", default="bench_results.json")
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("compare", help="compare two pipeline result files")
+    p.add_argument("old")
+    p.add_argument("new")
+    p.set_defaults(func=bench_compare)
+
+    p = sub.add_parser("webhook", help="webhook front-end throughput against a fake Telegram")
+    p.add_argument("--updates", type=int, default=2000)
+    p.add_argument("--connections", type=int, default=40, help="parallel webhook connections, as max_connections")
+    p.add_argument("--in-flight", type=scales, default=[1, 64], help="comma-separated WEBHOOK_MAX_IN_FLIGHT values")
+    p.add_argument("--api-latency", type=float, default=0.05, help="simulated Bot API latency, seconds")
+    p.add_argument("--timeout", type=float, default=120)
+    p.set_defaults(func=bench_webhook)
+
+    args = parser.parse_args()
+    asyncio.run(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
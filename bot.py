@@ -1,20 +1,46 @@
 # bot.py
+import startup  # первым: от него отсчитываются этапы старта
 import os
+if __name__ == "__main__":
+    startup.listen_early(int(os.getenv("PORT", 10000)))  # health check отвечает, пока грузится aiogram
+import hmac
+import json
 import asyncio
 import logging
 from datetime import datetime
-from aiogram import Bot, Dispatcher, types
-from aiogram.filters import Command
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from aiohttp import web
-
-import tender_parser  # импортируем твой parser.py
+from functools import partial
+from collections import OrderedDict
+with startup.timed_import("aiohttp"):
+    from aiohttp import web
+with startup.timed_import("aiogram"):
+    from aiogram import Bot, Dispatcher, types
+    from aiogram.filters import Command, CommandObject
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+# парсеры площадок (lxml, fetcher) здесь не импортируются — их подгружает workers к первому опросу
+with startup.timed_import("app"):
+    import db
+    import metrics
+    import outbox
+    import rules
+    from delivery import DeliveryQueue
+    import storage
+    import scheduler
+    import sync_state
+    import workers
 
 
 # --- Настройки ---
 TOKEN = os.getenv("BOT_TOKEN")  # токен берётся с Render (из Dashboard → Environment)
 PORT = int(os.getenv("PORT", 10000))
-POLL_INTERVAL_SECONDS = int(os.getenv("POLL_INTERVAL_SECONDS", 300))  # каждые 5 минут
+OUTBOX_IDLE_SECONDS = int(os.getenv("OUTBOX_IDLE_SECONDS", 5))  # как часто заглядывать в пустой outbox
+BACKFILL_DAYS = int(os.getenv("BACKFILL_DAYS", 7))  # за сколько дней прислать тендеры по новой подписке
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", 10000))  # готовых текстов тендеров в памяти
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # например https://tenderubot.onrender.com — включает webhook вместо polling
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Telegram присылает его в X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", 64))  # обновлений в обработке одновременно
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # свой Bot API сервер (или фейковый из bench.py)
 
 if not TOKEN:
     raise RuntimeError("BOT_TOKEN not set in environment variables!")
@@ -26,13 +52,33 @@ logging.basicConfig(
     handlers=[logging.FileHandler("bot.log"), logging.StreamHandler()]
 )
 
-bot = Bot(token=TOKEN)
+if TELEGRAM_API_URL:
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    bot = Bot(token=TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)))
+else:
+    bot = Bot(token=TOKEN)
 dp = Dispatcher()
+delivery = DeliveryQueue(bot)  # очередь отправки уведомлений
+OUTBOX_WAKEUP = asyncio.Event()  # будит отправителя, когда в outbox появились записи
+READY = asyncio.Event()  # схема создана и подписки загружены
+metrics.QUEUE_DEPTH.labels("delivery").set_function(delivery.pending)
 
 AWAITING_KEYWORD = {}  # user_id -> "add" или "remove"
+DIGEST_MODES = {"сразу": "instant", "instant": "instant", "час": "hourly", "hourly": "hourly",
+                "день": "daily", "daily": "daily"}  # аргумент /digest -> режим outbox
+DIGEST_MODE_NAMES = {"instant": "сразу", "hourly": "раз в час", "daily": "раз в день"}
 
 
 # --- Команды ---
+@dp.update.outer_middleware()
+async def wait_ready(handler, event, data):
+    # обновления принимаются сразу после старта, а обрабатываются, когда готова БД
+    if not READY.is_set():
+        await READY.wait()
+    return await handler(event, data)
+
+
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
     await message.answer(
@@ -50,8 +96,13 @@ async def cmd_help(message: types.Message):
         "/help — помощь\n"
         "/about — информация\n"
         "/addkeyword — добавить ключевое слово\n"
+        "   например: /addkeyword трубы сумма:1млн-50млн площадка:госзакупки\n"
+        "   опции: где:название|заказчик|везде, сумма:ОТ-ДО, площадка:имя,имя,\n"
+        "   формы — искать и другие формы слова (трубы → труб, трубами)\n"
         "/removekeyword — удалить ключевое слово\n"
         "/listkeywords — список подписок\n"
+        "/digest — как присылать: сразу, раз в час или раз в день\n"
+        "/search <запрос> — поиск по сохранённым тендерам\n"
         "/parse — принудительно запустить парсер"
     )
 
@@ -72,25 +123,30 @@ async def handle_callback(callback: types.CallbackQuery):
         if data == "about_info":
             await callback.message.answer("🤖 Я нахожу тендеры по площадкам Казахстана и отправляю их по ключевым словам.")
         elif data == "about_stats":
-            conn = tender_parser.get_conn()
-            cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM tenders")
-            total = cur.fetchone()[0]
-            cur.execute("SELECT COUNT(DISTINCT user_id) FROM subscriptions")
-            users_row = cur.fetchone()
-            users = users_row[0] if users_row else 0
-            conn.close()
-            await callback.message.answer(f"📊 В базе тендеров: {total}\nПодписчиков: {users}")
+            stats = await storage.run(db.stats)
+            sources = "\n".join(f"  {name or '—'}: {count}" for name, count in sorted(stats["sources"].items()))
+            await callback.message.answer(
+                f"📊 В базе тендеров: {stats['tenders']}\n"
+                f"В архиве: {stats['archived']}\n"
+                f"Подписчиков: {stats['subscribers']}"
+                + (f"\n\nПо площадкам:\n{sources}" if sources else "")
+            )
         await callback.answer()
     except Exception:
         logging.exception("Ошибка при обработке callback")
 
 
 @dp.message(Command("addkeyword"))
-async def cmd_addkeyword(message: types.Message):
+async def cmd_addkeyword(message: types.Message, command: CommandObject):
     user_id = message.from_user.id
+    if command.args and command.args.strip():
+        await add_keyword(message, user_id, command.args)
+        return
     AWAITING_KEYWORD[user_id] = "add"
-    await message.answer("✍️ Введите ключевое слово, на которое хотите подписаться.")
+    await message.answer(
+        "✍️ Введите ключевое слово, на которое хотите подписаться.\n"
+        "Можно с опциями: где:заказчик, сумма:100000-5млн, площадка:госзакупки, формы"
+    )
 
 
 @dp.message(Command("removekeyword"))
@@ -103,7 +159,7 @@ async def cmd_removekeyword(message: types.Message):
 @dp.message(Command("listkeywords"))
 async def cmd_listkeywords(message: types.Message):
     user_id = message.from_user.id
-    rows = tender_parser.list_user_keywords(user_id)
+    rows = db.list_user_keywords(user_id)
     if not rows:
         await message.answer("У вас пока нет подписок.")
     else:
@@ -112,14 +168,52 @@ async def cmd_listkeywords(message: types.Message):
 
 @dp.message(Command("parse"))
 async def cmd_parse(message: types.Message):
-    await message.answer("🔍 Запрашиваю новые тендеры...")
-
+    # опрашивает тот, кто держит аренду площадок, со своим состоянием и отметками;
+    # новые тендеры разошлются по подпискам обычным путём
     try:
-        new = await run_parser_once_and_notify()
-        await message.answer(f"✅ Готово. Добавлено {len(new)} новых тендеров.")
+        await workers.request_poll()
+        await message.answer("🔍 Запросил опрос площадок, новые тендеры придут по подпискам.")
     except Exception as e:
-        logging.exception("Ошибка при парсинге")
-        await message.answer(f"⚠️ Ошибка при парсинге: {e}")
+        logging.exception("Ошибка при запросе опроса")
+        await message.answer(f"⚠️ Ошибка при запросе опроса: {e}")
+
+
+@dp.message(Command("search"))
+async def cmd_search(message: types.Message, command: CommandObject):
+    query = (command.args or "").strip()
+    if not query:
+        await message.answer("🔎 Использование: /search <запрос>, например /search трубы")
+        return
+
+    results = await storage.run(db.search_tenders, query, 10)
+    if not results:
+        await message.answer("Ничего не найдено.")
+        return
+    lines = [f"— {t.name} ({t.customer or 'заказчик не указан'}, {t.amount})" for t in results]
+    await message.answer(("🔎 Найдено:\n" + "\n".join(lines))[:4096])
+
+
+@dp.message(Command("digest"))
+async def cmd_digest(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    arg = (command.args or "").strip().lower()
+    if not arg:
+        mode = await storage.run(outbox.delivery_mode, user_id)
+        await message.answer(
+            f"📬 Сейчас тендеры приходят: {DIGEST_MODE_NAMES[mode]}.\n"
+            "Изменить: /digest сразу, /digest час или /digest день — "
+            "тогда найденное копится и приходит одной подборкой."
+        )
+        return
+    mode = DIGEST_MODES.get(arg)
+    if mode is None:
+        await message.answer("❌ Бывает: /digest сразу, /digest час или /digest день.")
+        return
+    moved = await storage.run(outbox.set_delivery_mode, user_id, mode)
+    if mode == "instant":
+        OUTBOX_WAKEUP.set()
+    note = f" Накопленные тендеры ({moved}) придут по новому расписанию." if moved else ""
+    await message.answer(f"✅ Теперь тендеры приходят: {DIGEST_MODE_NAMES[mode]}.{note}")
 
 
 # --- Обработка текстов ---
@@ -136,91 +230,283 @@ async def handle_message(message: types.Message):
             return
 
         if action == "add":
-            tender_parser.add_subscription(user_id, keyword)
-            await message.answer(f"✅ Подписка на '{keyword}' добавлена.")
+            await add_keyword(message, user_id, keyword)
         elif action == "remove":
-            tender_parser.remove_subscription(user_id, keyword)
+            await storage.run(db.remove_subscription, user_id, keyword)
             await message.answer(f"🗑️ Подписка на '{keyword}' удалена (если была).")
         return
 
     await message.answer("💡 Введите команду /help, чтобы увидеть список доступных команд.")
 
 
+async def add_keyword(message, user_id, text):
+    try:
+        keyword = rules.parse(text).spec
+    except ValueError as e:
+        await message.answer(f"❌ {e}. Подписка не добавлена, см. /help.")
+        return
+    await storage.run(db.add_subscription, user_id, keyword)
+    await message.answer(f"✅ Подписка на '{keyword}' добавлена.")
+    await backfill_subscription(message, user_id, keyword)
+
+
 # --- Запуск парсера ---
-async def run_parser_once_and_notify():
-    loop = asyncio.get_event_loop()
-    tenders = await loop.run_in_executor(None, tender_parser.fetch_tenders, 50)
-    added = tenders  # если save_new_tenders не используется, можно возвращать сразу
-
-    if not added:
-        logging.info("Новых тендеров нет.")
-        return []
-
-    subs = tender_parser.get_subscriptions()
-    notifications = {}
-    for t in added:
-        name = (t.get("name") or "").lower()
-        summary = (
-            f"📌 {t.get('name')}\n"
-            f"Номер: {t.get('purchase_number')}\n"
-            f"Заказчик: {t.get('customer')}\n"
-            f"Сумма: {t.get('amount')}\n"
-            f"Дата: {t.get('publish_date')}"
-        )
-        for kw, users in subs.items():
-            if kw in name:
-                for u in users:
-                    notifications.setdefault(u, []).append(summary)
+def render_tender(t):
+    return (
+        f"📌 {t.name}\n"
+        f"Номер: {t.purchase_number}\n"
+        f"Заказчик: {t.customer}\n"
+        f"Сумма: {t.amount}\n"
+        f"Дата: {t.publish_date}"
+    )
+
+
+_fragments = OrderedDict()  # tender_id -> готовый текст, общий для всех получателей
 
-    for user_id, msgs in notifications.items():
+
+def tender_fragment(t):
+    text = _fragments.get(t.id)
+    if text is not None:
+        _fragments.move_to_end(t.id)
+        return text
+    text = _fragments[t.id] = render_tender(t)
+    if len(_fragments) > FRAGMENT_CACHE_SIZE:
+        _fragments.popitem(last=False)
+    return text
+
+
+def notification_texts(tenders, digest):
+    # все тендеры пачки, без обрезки: строки outbox после отправки помечаются sent,
+    # так что отброшенное потерялось бы. pack_messages склеит их в минимум сообщений
+    texts = [tender_fragment(t) for t in tenders]
+    if digest and tenders:
+        texts.insert(0, f"📰 Подборка тендеров: {len(tenders)}")
+    return texts
+
+
+async def backfill_subscription(message, user_id, keyword):
+    # тендеры за последние BACKFILL_DAYS дней по новому слову — через тот же outbox
+    if BACKFILL_DAYS <= 0:
+        return
+    try:
+        matches = await storage.run(db.find_recent_matches, keyword, BACKFILL_DAYS)
+        if not matches:
+            return
+        queued = await storage.run(outbox.add, [(user_id, t.id) for t in matches])
+        OUTBOX_WAKEUP.set()
+        if queued:
+            mode = await storage.run(outbox.delivery_mode, user_id)
+            when = "сейчас пришлю" if mode == "instant" else "пришлю в ближайшей подборке"
+            await message.answer(f"📬 Нашёл {queued} тендеров за последние {BACKFILL_DAYS} дн., {when}.")
+    except Exception:
+        logging.exception("Ошибка при подборе тендеров по новой подписке")
+
+
+# --- Отправка из outbox ---
+def mark_delivered(ids, ok):
+    try:
+        if ok:
+            outbox.mark_sent(ids)
+        else:
+            outbox.mark_failed(ids)
+    except Exception:
+        logging.exception("Ошибка при обновлении статусов outbox")
+
+
+def on_delivered(ids, ok):
+    # по разу на каждое отправленное сообщение: ids — строки outbox, вошедшие в него
+    ids = [outbox_id for outbox_id in ids if outbox_id is not None]
+    if ids:
+        asyncio.ensure_future(storage.run(mark_delivered, ids, ok))
+
+
+async def send_outbox_batch(queue):
+    # забирает партию из outbox и ставит её в очередь отправки; -> размер партии
+    batch = await storage.run(outbox.claim_batch)
+    by_user = {}
+    digests = set()
+    for outbox_id, user_id, t, held in batch:
+        by_user.setdefault(user_id, []).append((outbox_id, t))
+        if held:
+            digests.add(user_id)
+    for user_id, rows in by_user.items():
+        # тендер могли удалить, пока строка ждала — отправлять нечего
+        gone = [outbox_id for outbox_id, t in rows if t is None]
+        if gone:
+            on_delivered(gone, True)
+        rows = [(outbox_id, t) for outbox_id, t in rows if t is not None]
+        texts = notification_texts([t for _, t in rows], user_id in digests)
+        # заголовок подборки (если есть) идёт первым и строкой outbox не является
+        keys = [None] * (len(texts) - len(rows)) + [outbox_id for outbox_id, _ in rows]
+        queue.enqueue(user_id, texts, on_done=on_delivered, keys=keys)
+    return len(batch)
+
+
+async def outbox_sender():
+    await READY.wait()
+    await storage.run(outbox.release_in_flight)
+    while True:
         try:
-            for m in msgs[:10]:
-                await bot.send_message(chat_id=user_id, text=m)
-            if len(msgs) > 10:
-                await bot.send_message(chat_id=user_id, text=f"...и ещё {len(msgs)-10} тендеров.")
+            OUTBOX_WAKEUP.clear()
+            if not await send_outbox_batch(delivery):
+                try:
+                    await asyncio.wait_for(OUTBOX_WAKEUP.wait(), OUTBOX_IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # не забираем следующую партию, пока очередь отправки не разгрузится
+            while delivery.pending() > outbox.OUTBOX_BATCH_SIZE:
+                await asyncio.sleep(0.5)
         except Exception:
-            logging.exception(f"Ошибка при уведомлении пользователя {user_id}")
-
-    logging.info(f"Отправлено уведомлений {len(notifications)} пользователям.")
-    return added
+            logging.exception("Ошибка при отправке из outbox")
+            await asyncio.sleep(OUTBOX_IDLE_SECONDS)
 
 
 # --- Фоновая задача ---
 async def polling_task():
-    await asyncio.sleep(10)
-    while True:
+    # у каждой площадки своё расписание (scheduler.py); опрашиваем только свою долю (leases.py).
+    # Множество виденных тендеров прогревается здесь, а не до открытия порта
+    await READY.wait()
+    await storage.run(db.load_seen_tenders)
+    await storage.run(sync_state.load)
+    await workers.fetch_loop()
+
+
+async def matching_task():
+    await READY.wait()
+    await asyncio.gather(workers.match_loop(on_queued=OUTBOX_WAKEUP.set), workers.maintenance_loop())
+
+
+# --- Webhook ---
+class WebhookHandler:
+    # отвечает Telegram сразу, а обновление отдаёт dp.feed_raw_update в фоне.
+    # Одновременно в работе не больше limit обновлений — следующий запрос ждёт
+    # свободного слота, и Telegram сам притормаживает отправку
+    def __init__(self, limit):
+        self.slots = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.tasks = set()  # ссылки на фоновые задачи, чтобы их не собрал GC
+
+    async def handle(self, request):
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if WEBHOOK_SECRET and not hmac.compare_digest(token, WEBHOOK_SECRET):
+            return web.Response(status=401, text="Unauthorized")
+        update = await request.json()
+        await self.slots.acquire()
+        self.in_flight += 1
+        task = asyncio.create_task(self._feed(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.json_response({})
+
+    async def _feed(self, update):
         try:
-            logging.info("⏳ Автоматический запуск парсера...")
-            await run_parser_once_and_notify()
-            logging.info("✅ Парсер завершён, спим...")
+            await dp.feed_raw_update(bot, update)
         except Exception:
-            logging.exception("Ошибка в фоновой задаче парсинга")
-        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            metrics.ERRORS.labels("update").inc()
+            logging.exception("Ошибка при обработке обновления")
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+
+def setup_webhook(app):
+    handler = WebhookHandler(WEBHOOK_MAX_IN_FLIGHT)
+    app.router.add_post(WEBHOOK_PATH, handler.handle)
+    metrics.QUEUE_DEPTH.labels("webhook").set_function(lambda: handler.in_flight)
+    return handler
+
+
+async def set_webhook():
+    # вызывается, когда сервер уже слушает порт
+    url = WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH
+    await bot.set_webhook(
+        url,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=max(1, min(WEBHOOK_MAX_IN_FLIGHT, 100)),  # Telegram допускает 1–100
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logging.info(f"🔗 Webhook установлен: {url}")
 
 
 # --- Web сервер для Render ---
 async def handle_root(request):
+    startup.mark("first_health")
     return web.Response(text="TenderuBot is running ✅")
 
 
-async def start_webserver():
+async def handle_startup(request):
+    return web.json_response(startup.report())
+
+
+async def handle_schedule(request):
+    return web.json_response(scheduler.snapshot(), dumps=partial(json.dumps, ensure_ascii=False))
+
+
+async def handle_metrics(request):
+    # глубину outbox считаем только когда метрики действительно запрашивают
+    metrics.QUEUE_DEPTH.labels("outbox").set(await storage.run(outbox.pending_count))
+    return web.Response(body=metrics.render().encode("utf-8"), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+async def start_webserver(roles=("front", "fetch", "match")):
     app = web.Application()
     app.router.add_get("/", handle_root)
+    if "fetch" in roles:
+        # без сборщика в этом процессе расписание здесь не ведётся: его /schedule
+        # отдают процессы workers.py fetch на своём METRICS_PORT
+        app.router.add_get("/schedule", handle_schedule)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/startup", handle_startup)
+    if WEBHOOK_URL:
+        setup_webhook(app)
     runner = web.AppRunner(app)
     await runner.setup()
+    await asyncio.to_thread(startup.stop_early)
     site = web.TCPSite(runner, "0.0.0.0", PORT)
     await site.start()
+    startup.mark("listening")
     logging.info(f"🌐 Web server started on port {PORT}")
+    if WEBHOOK_URL:
+        await set_webhook()
+    return runner
+
+
+async def start_polling():
+    # webhook, оставшийся от запуска с WEBHOOK_URL, не даёт getUpdates получать обновления
+    await bot.delete_webhook()
+    await dp.start_polling(bot)
 
 
 # --- Main ---
-async def main():
-    tender_parser.create_tables()
-    await asyncio.gather(
-        start_webserver(),
-        polling_task(),
-        dp.start_polling(bot)
-    )
+async def prepare_db():
+    # схема и подписки — в фоне: порт к этому моменту уже открыт
+    await storage.run(storage.create_tables)
+    startup.mark("schema")
+    await storage.run(db.load_subscriptions)
+    READY.set()
+    startup.mark("ready")
+
+
+async def main(roles=("front", "fetch", "match")):
+    # по умолчанию всё в одном процессе; workers.py запускает роли по отдельности.
+    # Сначала порт и приём обновлений Telegram, потом БД и прогрев
+    startup.mark("main")
+    await start_webserver(roles)
+    await delivery.start()
+    tasks = [prepare_db(), outbox_sender(), metrics.watch_loop_lag()]
+    if not WEBHOOK_URL:
+        tasks.append(start_polling())
+    if "fetch" in roles:
+        tasks.append(polling_task())
+    if "match" in roles:
+        tasks.append(matching_task())
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await delivery.stop()
+        await workers.close_fetcher()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,19 @@
-import sqlite3
-from datetime import datetime
+import os
 import logging
+from datetime import datetime, timedelta
 
-DB_PATH = "database.db"
+import dedup
+import rules
+import neardup
+import metrics
+import storage
+import subscriptions
+import sync_state
+from models import Tender
+from storage import DB_PATH
+
+SUBSCRIPTION_LOG_KEEP = int(os.getenv("SUBSCRIPTION_LOG_KEEP", 100000))  # записей журнала подписок
+TENDER_RETENTION_DAYS = int(os.getenv("TENDER_RETENTION_DAYS", 180))  # старше — в архив (maintenance.py); 0 — хранить всё
 
 logging.basicConfig(
     filename="parser.log",
@@ -10,105 +21,259 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
-def get_conn():
-    return sqlite3.connect(DB_PATH, timeout=30)
-
 def create_tables():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS tenders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            purchase_number TEXT UNIQUE,
-            name TEXT,
-            customer TEXT,
-            amount REAL,
-            publish_date TEXT,
-            inserted_at TEXT
-        )
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS subscriptions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            keyword TEXT,
-            UNIQUE(user_id, keyword)
-        )
-    """)
-    conn.commit()
-    conn.close()
-    logging.info("DB tables ensured.")
+    storage.create_tables()
+    load_subscriptions()
+    load_seen_tenders()
+    sync_state.load()
 
+# ----------------- Тендеры -----------------
 def save_new_tenders(tenders):
-    conn = get_conn()
-    cur = conn.cursor()
-    added = []
+    # Весь пакет пишется одной транзакцией: строки складываются во временную
+    # таблицу, а в tenders переносятся через ON CONFLICT DO NOTHING RETURNING,
+    # так что назад возвращаются только действительно новые тендеры
+    # (те же объекты models.Tender, с заполненным id).
+    # Тендеры, опубликованные раньше окна хранения, не вставляются: их уже
+    # могли унести в архив, и без этой проверки они пришли бы заново.
+    # Тендеры без даты ловит archived_keys — ключи всего, что ушло в архив.
+    rows = {}
+    stale = []
+    now = datetime.utcnow().isoformat()
+    expired = datetime.utcnow() - timedelta(days=TENDER_RETENTION_DAYS) if TENDER_RETENTION_DAYS > 0 else None
     for t in tenders:
-        name = t.get("name") or t.get("title") or ""
-        purchase_number = t.get("purchase_number") or t.get("id") or ""
-        customer = t.get("customer") or t.get("ref_customer_name_ru") or ""
-        amount = t.get("amount") or 0
-        publish_date = t.get("publish_date") or t.get("date") or ""
-        if not purchase_number:
+        if not t.purchase_number or t.purchase_number in rows:
             continue
-        try:
+        if expired and t.published is not None and t.published < expired:
+            stale.append(t)
+            continue
+        rows[t.purchase_number] = t
+    if stale:
+        dedup.seed((t.source, t.purchase_number) for t in stale)
+        metrics.DUPLICATES.labels("stale").inc(len(stale))
+    if not rows:
+        return []
+
+    added = []
+    duplicates = {}
+    try:
+        with metrics.DB_WRITE_SECONDS.labels("tenders").time(), storage.transaction() as conn:
+            cur = conn.cursor()
             cur.execute("""
-                INSERT INTO tenders (purchase_number, name, customer, amount, publish_date, inserted_at)
+                CREATE TEMP TABLE IF NOT EXISTS incoming_tenders (
+                    seq INTEGER PRIMARY KEY,
+                    purchase_number TEXT,
+                    name TEXT,
+                    customer TEXT,
+                    amount REAL,
+                    publish_date TEXT,
+                    source TEXT
+                )
+            """)
+            cur.execute("DELETE FROM incoming_tenders")
+            cur.executemany("""
+                INSERT INTO incoming_tenders (purchase_number, name, customer, amount, publish_date, source)
                 VALUES (?, ?, ?, ?, ?, ?)
-            """, (str(purchase_number), name, customer, amount, publish_date, datetime.utcnow().isoformat()))
-            conn.commit()
-            added.append({
-                "purchase_number": purchase_number,
-                "name": name,
-                "customer": customer,
-                "amount": amount,
-                "publish_date": publish_date
-            })
-        except sqlite3.IntegrityError:
-            continue
-        except Exception:
-            logging.exception("Error inserting tender")
-    conn.close()
-    logging.info(f"Added {len(added)} new tenders.")
+            """, [t.db_row() for t in rows.values()])
+            cur.execute("""
+                INSERT INTO tenders (purchase_number, name, customer, amount, publish_date, source, inserted_at)
+                SELECT purchase_number, name, customer, amount, publish_date, source, ?
+                FROM incoming_tenders
+                WHERE purchase_number NOT IN (SELECT purchase_number FROM archived_keys)
+                ORDER BY seq
+                ON CONFLICT(purchase_number) DO NOTHING
+                RETURNING id, purchase_number
+            """, (now,))
+            for tender_id, purchase_number in cur.fetchall():
+                t = rows[purchase_number]
+                t.id = tender_id
+                added.append(t)
+            cur.execute("DELETE FROM incoming_tenders")
+            try:
+                # копии уже известных тендеров с других площадок помечаются duplicate_of
+                duplicates = neardup.mark(conn, added)
+            except Exception:
+                logging.exception("Near-duplicate check failed, saving batch without it")
+                metrics.ERRORS.labels("neardup").inc()
+        # после коммита все ключи пакета уже есть в БД — и новые, и конфликтные
+        dedup.seed((t.source, t.purchase_number) for t in rows.values())
+        for t in added:
+            metrics.TENDERS_NEW.labels(t.source).inc()
+        metrics.DUPLICATES.labels("db").inc(len(rows) - len(added))
+        metrics.DUPLICATES.labels("neardup").inc(len(duplicates))
+    except Exception:
+        logging.exception("Error inserting tenders batch")
+        metrics.ERRORS.labels("db").inc()
+        sync_state.discard()  # пакет не сохранён — отметки площадок не двигаем
+        added = []
+    added.sort(key=lambda t: t.id)
+    logging.info(f"Added {len(added)} new tenders out of {len(tenders)} ({len(duplicates)} near-duplicates).")
     return added
 
+def count_tenders():
+    # счётчики ведут триггеры storage.py, чтение — O(1)
+    return stats()["tenders"]
+
+def stats():
+    # -> {"tenders", "archived", "subscribers", "sources": {площадка: тендеров}}
+    with storage.connection() as conn:
+        counters = dict(conn.execute("SELECT name, value FROM stats_counters"))
+    return {
+        "tenders": counters.get("tenders", 0),
+        "archived": counters.get("archived", 0),
+        "subscribers": counters.get("subscribers", 0),
+        "sources": {name[len("source:"):]: value for name, value in counters.items()
+                    if name.startswith("source:") and value > 0},
+    }
+
+TENDER_COLUMNS = ("id", "purchase_number", "name", "customer", "amount", "publish_date", "source")
+
+def fts_query(text, column=None):
+    # каждое слово — основа (rules.normalize, ё -> е, как в индексе) префиксным термом в кавычках:
+    # «трубы» ищет «труб*» и находит и «труб», и «трубами»; кавычки не дают ввод сломать синтаксис FTS5
+    tokens = rules.normalize(text.lower()).split()
+    if not tokens:
+        return ""
+    query = " ".join(f'"{t}"*' for t in tokens)
+    return f"{column} : ({query})" if column else query
+
+def search_tenders(text, limit=10):
+    # свободный поиск /search: слова ищутся с начала слова и ранжируются FTS,
+    # в отличие от подписок (find_recent_matches), где по умолчанию ищется подстрока
+    query = fts_query(text)
+    if not query:
+        return []
+    with storage.connection() as conn:
+        rows = conn.execute(f"""
+            SELECT {", ".join("t." + c for c in TENDER_COLUMNS)}
+            FROM tenders_fts JOIN tenders t ON t.id = tenders_fts.rowid
+            WHERE tenders_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (query, limit)).fetchall()
+    return [Tender.from_db(row) for row in rows]
+
+def find_recent_matches(keyword, days, limit=200):
+    # тендеры последних days дней, подходящие под правило, как при живом сопоставлении;
+    # -> не больше limit, от новых к старым
+    rule = rules.parse(keyword)
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    columns = ", ".join("t." + c for c in TENDER_COLUMNS)
+    if rule.exact:
+        # подстрока бывает и в середине слова («бетон» в «железобетонных»), а FTS ищет
+        # только с начала слова — поэтому окно просматриваем по индексу inserted_at
+        sql = f"SELECT {columns}, t.duplicate_of FROM tenders t WHERE t.inserted_at >= ? ORDER BY t.id DESC"
+        params = (since,)
+    else:
+        # основы слов как префиксы; короткие основы (только слово целиком) отсеет rule.matches
+        query = fts_query(rule.text, column=rule.fts_column())
+        if not query:
+            return []
+        sql = f"""
+            SELECT {columns}, t.duplicate_of
+            FROM tenders_fts JOIN tenders t ON t.id = tenders_fts.rowid
+            WHERE tenders_fts MATCH ? AND t.inserted_at >= ?
+            ORDER BY t.id DESC
+        """
+        params = (query, since)
+    matched = {}
+    with storage.connection() as conn:
+        cur = conn.execute(sql, params)
+        for row in cur:
+            # без подстроки ни в названии, ни в заказчике тендер не собираем
+            if rule.exact and rule.needle not in f"{row[2]}\n{row[3]}".lower():
+                continue
+            t = Tender.from_db(row[:-1])
+            if rule.matches(t):
+                matched[t.id] = (t, row[-1])
+                if len(matched) >= limit:
+                    break
+        cur.close()
+    # копию с другой площадки не присылаем, если оригинал тоже подошёл
+    return [t for t, original in matched.values() if original not in matched]
+
+def prune_near_duplicates(days=neardup.NEARDUP_WINDOW_DAYS):
+    with storage.transaction() as conn:
+        return neardup.prune(conn, days)
+
+def load_seen_tenders():
+    with storage.connection() as conn:
+        # сначала архив: LRU должно остаться с самыми свежими ключами
+        dedup.seed(conn.execute("SELECT source, purchase_number FROM archived_keys"))
+        dedup.seed(conn.execute("SELECT source, purchase_number FROM tenders ORDER BY id"))
+    logging.info(f"Seen-set warmed: {dedup.stats()}")
+
+# ----------------- Подписки -----------------
+def load_subscriptions():
+    with storage.connection() as conn:
+        # номер журнала читаем до подписок: всё, что изменится между запросами,
+        # просто применится ещё раз при sync_subscriptions
+        log_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM subscription_log").fetchone()[0]
+        rows = conn.execute("SELECT user_id, keyword FROM subscriptions").fetchall()
+    subscriptions.load(rows, log_seq)
+    logging.info(f"Loaded {len(rows)} subscriptions into memory.")
+
+def sync_subscriptions():
+    # догоняет индекс по изменениям, сделанным другими процессами
+    if not subscriptions.is_loaded():
+        load_subscriptions()
+        return 0
+    last = subscriptions.log_seq()
+    with storage.connection() as conn:
+        first = conn.execute("SELECT MIN(seq) FROM subscription_log").fetchone()[0]
+        entries = conn.execute(
+            "SELECT seq, op, user_id, keyword FROM subscription_log WHERE seq > ? ORDER BY seq", (last,)
+        ).fetchall()
+    if first is not None and first > last + 1:
+        # нужные записи уже вычищены из журнала — перечитываем подписки целиком
+        load_subscriptions()
+        return len(entries)
+    subscriptions.apply_log(entries)
+    return len(entries)
+
+def prune_subscription_log(keep=SUBSCRIPTION_LOG_KEEP):
+    # последняя запись остаётся всегда — по ней sync_subscriptions видит разрыв
+    with storage.transaction() as conn:
+        return conn.execute(
+            "DELETE FROM subscription_log WHERE seq <= (SELECT MAX(seq) FROM subscription_log) - ?", (max(keep, 1),)
+        ).rowcount
+
 def get_subscriptions():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT user_id, keyword FROM subscriptions")
-    rows = cur.fetchall()
-    conn.close()
-    subs = {}
-    for user_id, keyword in rows:
-        subs.setdefault(keyword.lower(), set()).add(user_id)
-    return subs
+    if not subscriptions.is_loaded():
+        load_subscriptions()
+    return subscriptions.snapshot()
 
 def add_subscription(user_id: int, keyword: str):
-    conn = get_conn()
-    cur = conn.cursor()
+    # keyword — правило с опциями (rules.py); неверное правило — ValueError
+    keyword = rules.parse(keyword).spec
     try:
-        cur.execute("INSERT OR IGNORE INTO subscriptions (user_id, keyword) VALUES (?, ?)", (user_id, keyword.strip().lower()))
-        conn.commit()
+        with storage.transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO subscriptions (user_id, keyword) VALUES (?, ?)",
+                (user_id, keyword)
+            )
+        subscriptions.add(user_id, keyword)
     except Exception:
         logging.exception("Failed to add subscription")
-    finally:
-        conn.close()
 
 def remove_subscription(user_id: int, keyword: str):
-    conn = get_conn()
-    cur = conn.cursor()
+    # удаляем и каноническую форму правила, и строку как есть (старые подписки)
+    keywords = {keyword.strip().lower()}
+    try:
+        keywords.add(rules.parse(keyword).spec)
+    except ValueError:
+        pass
     try:
-        cur.execute("DELETE FROM subscriptions WHERE user_id=? AND keyword=?", (user_id, keyword.strip().lower()))
-        conn.commit()
+        with storage.transaction() as conn:
+            conn.executemany(
+                "DELETE FROM subscriptions WHERE user_id=? AND keyword=?",
+                [(user_id, kw) for kw in keywords]
+            )
+        for kw in keywords:
+            subscriptions.remove(user_id, kw)
     except Exception:
         logging.exception("Failed to remove subscription")
-    finally:
-        conn.close()
 
 def list_user_keywords(user_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT keyword FROM subscriptions WHERE user_id=?", (user_id,))
-    rows = [r[0] for r in cur.fetchall()]
-    conn.close()
-    return rows
+    if not subscriptions.is_loaded():
+        load_subscriptions()
+    return sorted(subscriptions.keywords_for(user_id))
@@ -0,0 +1,130 @@
+# dedup.py — тёплый слой дедупликации по (source, purchase_number)
+#
+# Bloom-фильтр покрывает всю историю и быстро отвечает «точно новый»;
+# точное LRU-множество последних ключей подтверждает «уже видели».
+# Отбрасываем тендер только при подтверждении LRU, поэтому ложные
+# срабатывания фильтра ничего не теряют — такие ключи просто уходят в БД.
+import os
+import sys
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+
+SEEN_CAPACITY = int(os.getenv("SEEN_CAPACITY", 1_000_000))  # ожидаемое число ключей в фильтре
+SEEN_FP_RATE = float(os.getenv("SEEN_FP_RATE", 0.001))
+SEEN_LRU_SIZE = int(os.getenv("SEEN_LRU_SIZE", 200_000))
+
+
+class BloomFilter:
+    def __init__(self, capacity, fp_rate):
+        self.size = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        new = False
+        for pos in self._positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        self.count += new
+        return new
+
+    def __contains__(self, key):
+        for pos in self._positions(key):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                return False
+        return True
+
+    def fp_rate(self):
+        # оценка вероятности ложного срабатывания при текущем заполнении
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+
+
+_lock = threading.Lock()
+_bloom = BloomFilter(SEEN_CAPACITY, SEEN_FP_RATE)
+_recent = OrderedDict()  # key -> None, в порядке последнего обращения
+_counters = {"hits": 0, "misses": 0, "bloom_unconfirmed": 0}
+
+
+def make_key(source, purchase_number):
+    return f"{source or ''}\x1f{purchase_number}"
+
+
+def _remember(key):
+    _bloom.add(key)
+    _recent[key] = None
+    _recent.move_to_end(key)
+    if len(_recent) > SEEN_LRU_SIZE:
+        _recent.popitem(last=False)
+
+
+def seed(rows):
+    # rows — (source, purchase_number) от старых к новым
+    with _lock:
+        for source, purchase_number in rows:
+            _remember(make_key(source, purchase_number))
+
+
+def add(source, purchase_number):
+    with _lock:
+        _remember(make_key(source, purchase_number))
+
+
+def seen(source, purchase_number):
+    key = make_key(source, purchase_number)
+    with _lock:
+        if key not in _bloom:
+            _counters["misses"] += 1
+            return False
+        if key in _recent:
+            _recent.move_to_end(key)
+            _counters["hits"] += 1
+            return True
+        # фильтр ответил «может быть», но точного подтверждения нет — пусть решает БД
+        _counters["bloom_unconfirmed"] += 1
+        _counters["misses"] += 1
+        return False
+
+
+def stats():
+    with _lock:
+        # размер ключей оцениваем по выборке, чтобы не обходить всё множество
+        sample = [sys.getsizeof(k) for _, k in zip(range(100), _recent)]
+        key_bytes = sum(sample) / len(sample) if sample else 0
+        lru_bytes = sys.getsizeof(_recent) + int(key_bytes * len(_recent))
+        return {
+            "bloom_bytes": len(_bloom.bits),
+            "bloom_keys": _bloom.count,
+            "bloom_fp_rate": _bloom.fp_rate(),
+            "lru_entries": len(_recent),
+            "lru_bytes": lru_bytes,
+            **_counters,
+        }
+
+
+# считаются в момент запроса /metrics; _bloom берётся заново, reset() его подменяет
+metrics.SEEN_BYTES.labels("bloom").set_function(lambda: len(_bloom.bits))
+metrics.SEEN_BYTES.labels("lru").set_function(lambda: stats()["lru_bytes"])
+metrics.SEEN_FP_RATE.set_function(lambda: _bloom.fp_rate())
+
+
+def reset():
+    global _bloom
+    with _lock:
+        _bloom = BloomFilter(SEEN_CAPACITY, SEEN_FP_RATE)
+        _recent.clear()
+        for name in _counters:
+            _counters[name] = 0
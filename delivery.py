@@ -0,0 +1,213 @@
+# delivery.py — очередь отправки уведомлений в Telegram
+#
+# Пул воркеров разбирает общую очередь; скорость ограничивают два токен-бакета:
+# общий (лимит Telegram ~30 сообщений/с на бота) и отдельный на каждый чат.
+# Чатовый бакет воркер не ждёт: сообщение получает в нём слот заранее
+# (reserve) и, если слот в будущем, откладывается до него, а воркер берёт
+# следующее. Так несколько чатов с длинными пачками не занимают все воркеры.
+# bot — любой объект с async send_message(chat_id=..., text=...), так что
+# очередь можно гонять против фейкового бота.
+import os
+import time
+import random
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+import metrics
+
+MAX_MESSAGE_LENGTH = 4096  # лимит Telegram на длину текста
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", 4))
+GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", 25))  # сообщений в секунду на бота
+CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", 1))  # сообщений в секунду в один чат
+MAX_ATTEMPTS = int(os.getenv("DELIVERY_MAX_ATTEMPTS", 5))
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds):
+        # retry_after от Telegram: не выдаём токены, пока не истечёт пауза
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def is_idle(self):
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+    def reserve(self):
+        # токен выдаётся сразу, в долг; -> через сколько секунд им можно пользоваться
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate, self.paused_until - now)
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def pack_groups(texts, limit=MAX_MESSAGE_LENGTH, sep="\n\n"):
+    # склеивает тексты в минимальное число сообщений не длиннее limit;
+    # -> [(сообщение, [индексы вошедших в него текстов])]
+    messages = []
+    current = ""
+    group = []
+    for i, text in enumerate(texts):
+        text = text[:limit]
+        if not current:
+            current = text
+        elif len(current) + len(sep) + len(text) <= limit:
+            current += sep + text
+        else:
+            messages.append((current, group))
+            current = text
+            group = []
+        group.append(i)
+    if current:
+        messages.append((current, group))
+    return messages
+
+
+def pack_messages(texts, limit=MAX_MESSAGE_LENGTH, sep="\n\n"):
+    return [message for message, _ in pack_groups(texts, limit, sep)]
+
+
+class DeliveryQueue:
+    def __init__(self, bot, workers=DELIVERY_WORKERS, global_rate=GLOBAL_RATE, chat_rate=CHAT_RATE):
+        self.bot = bot
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_buckets = {}
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "flood_waits": 0}
+        self._tasks = []
+        self._delayed = set()  # отложенные повторы
+
+    def enqueue(self, chat_id, texts, on_done=None, keys=None):
+        # on_done(keys, ok) вызывается по разу на каждое сообщение после склейки, когда оно
+        # доставлено или брошено; keys — ключи вошедших в него текстов (keys[i] — у texts[i]),
+        # так что неудача одного сообщения не тянет за собой уже доставленные
+        messages = pack_groups(texts)
+        for text, group in messages:
+            job = None
+            if on_done:
+                job = (on_done, [keys[i] for i in group] if keys is not None else [])
+            self.queue.put_nowait((chat_id, text, 0, job, False))
+        return len(messages)
+
+    def _finish(self, job, ok):
+        if job is None:
+            return
+        on_done, keys = job
+        try:
+            on_done(keys, ok)
+        except Exception:
+            logging.exception("Delivery callback error")
+
+    def pending(self):
+        return self.queue.qsize() + len(self._delayed)
+
+    async def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks + list(self._delayed):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._delayed, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self):
+        await self.queue.join()
+        while self._delayed:
+            await asyncio.gather(*self._delayed, return_exceptions=True)
+            await self.queue.join()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.is_idle()}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=1)
+        return bucket
+
+    def _retry(self, item, delay):
+        chat_id, text, attempts, job, _ = item
+        if attempts + 1 >= MAX_ATTEMPTS:
+            self.stats["failed"] += 1
+            logging.error(f"Giving up on message to {chat_id} after {attempts + 1} attempts")
+            self._finish(job, False)
+            return
+        self.stats["retried"] += 1
+        self._later((chat_id, text, attempts + 1, job, False), delay)
+
+    def _later(self, item, delay):
+        task = asyncio.create_task(self._requeue(item, delay))
+        self._delayed.add(task)
+        task.add_done_callback(self._delayed.discard)
+
+    async def _requeue(self, item, delay):
+        await asyncio.sleep(delay)
+        self.queue.put_nowait(item)
+
+    async def _send(self, item):
+        chat_id, text, attempts, job, reserved = item
+        if not reserved:
+            delay = self._chat_bucket(chat_id).reserve()
+            if delay > 0:
+                # слоты чата выдаются по порядку, так что сообщения одного чата не перемешиваются
+                self._later((chat_id, text, attempts, job, True), delay)
+                return
+        await self.global_bucket.acquire()
+        try:
+            with metrics.SEND_SECONDS.time():
+                await self.bot.send_message(chat_id=chat_id, text=text)
+            self.stats["sent"] += 1
+            self._finish(job, True)
+        except TelegramRetryAfter as e:
+            self.stats["flood_waits"] += 1
+            metrics.FLOOD_WAITS.inc()
+            logging.warning(f"Flood wait {e.retry_after}s while sending to {chat_id}")
+            self.global_bucket.pause(e.retry_after)
+            self._retry(item, e.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest):
+            # бот заблокирован или чат недоступен — повторять бессмысленно
+            self.stats["failed"] += 1
+            metrics.ERRORS.labels("send").inc()
+            logging.exception(f"Cannot deliver message to {chat_id}")
+            self._finish(job, False)
+        except Exception:
+            metrics.ERRORS.labels("send").inc()
+            logging.exception(f"Error sending message to {chat_id}")
+            self._retry(item, min(60, 2 ** attempts) + random.random())
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self._send(item)
+            except Exception:
+                logging.exception("Delivery worker error")
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,215 @@
+# fetcher.py — асинхронная загрузка всех площадок
+import os
+import time
+import asyncio
+import logging
+
+import aiohttp
+
+import dedup
+import metrics
+import parsing
+import streaming
+import http_cache
+import sync_state
+from config import SITES
+
+# --- Настройки ---
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", 16))  # общий лимит соединений
+FETCH_PER_HOST = int(os.getenv("FETCH_PER_HOST", 2))  # лимит соединений на один хост
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", 15))  # дедлайн на площадку, на все её страницы
+FETCH_STREAMING = os.getenv("FETCH_STREAMING", "1") == "1"  # потоковый разбор JSON/XML/RSS
+SYNC_MAX_PAGES = int(os.getenv("SYNC_MAX_PAGES", 10))  # страниц за опрос на площадку
+
+_session = None
+
+
+# --- Общий пул соединений ---
+def get_session():
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=FETCH_CONCURRENCY, limit_per_host=FETCH_PER_HOST)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+# --- Загрузка одной страницы ---
+async def _download(session, url, headers):
+    async with session.get(url, headers=headers) as r:
+        if r.status == 304:
+            return r.status, r.headers, None, None
+        r.raise_for_status()
+        return r.status, r.headers, await r.read(), r.get_encoding()
+
+
+def _reached(mark, row):
+    # уже сохранённый тендер или отметка прошлого опроса
+    return dedup.seen(row[5], row[0]) or sync_state.crossed(mark, row[0], row[4])
+
+
+async def _replay(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _stream(session, site, url, headers, limit, mark, started, result):
+    # читает и разбирает ответ кусками; останавливается на limit или на отметке.
+    # -> (статус, заголовки, хэш тела или None, страница или None — не менялась)
+    rows = []
+    top = None
+    reached = False
+    meta = {}
+    async with session.get(url, headers=headers) as r:
+        if r.status == 304:
+            return r.status, r.headers, None, None
+        r.raise_for_status()
+        digest = chunks = None
+        if headers is not None and http_cache.is_unchanged(url, r.status, headers=r.headers):
+            return r.status, r.headers, None, None
+        if headers is not None and not (r.headers.get("ETag") or r.headers.get("Last-Modified")):
+            # первая страница без валидаторов: неизменность видна только по хэшу тела,
+            # поэтому его дочитываем и сверяем до разбора, а не разбираем всю ленту каждый опрос
+            body = [chunk async for chunk in r.content.iter_chunked(streaming.STREAM_CHUNK_BYTES)]
+            digest = http_cache.chunks_hash(body)
+            if http_cache.is_unchanged(url, r.status, digest):
+                return r.status, r.headers, digest, None
+            chunks = _replay(body)
+        async for row in streaming.iter_rows(site, r, meta, chunks):
+            if top is None:
+                top = row
+            if _reached(mark, row):
+                reached = result["stopped_at_seen"] = True
+                metrics.DUPLICATES.labels("fetch").inc()
+                break
+            if "first_item" not in result:
+                result["first_item"] = time.monotonic() - started
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        return r.status, r.headers, digest, (rows, top, parsing.next_url(url, meta.get("next_page")), reached)
+
+
+async def _fetch_page(session, site, url, limit, mark, started, result):
+    # -> None, если страница не менялась, иначе
+    # (новые кортежи, самый свежий кортеж страницы, ссылка на следующую, дошли ли до отметки)
+    cached = url == site["url"]  # ETag/хэш храним только для первой страницы
+    headers = http_cache.request_headers(url) if cached else None
+    if FETCH_STREAMING and site.get("type") in streaming.STREAM_TYPES:
+        status, resp_headers, digest, page = await _stream(session, site, url, headers, limit, mark, started, result)
+    else:
+        status, resp_headers, raw, encoding = await _download(session, url, headers)
+        digest = http_cache.body_hash(raw) if raw is not None else None
+        page = None
+    if cached and http_cache.is_unchanged(url, status, digest, resp_headers):
+        return None
+    if page is None:
+        rows, next_page = await parsing.parse(site, raw, encoding, limit)
+        # порядок на HTML-страницах не гарантирован, поэтому виденные отбрасываем, а не обрываемся на них
+        fresh = [row for row in rows if not _reached(mark, row)]
+        metrics.DUPLICATES.labels("fetch").inc(len(rows) - len(fresh))
+        page = (fresh, rows[0] if rows else None, parsing.next_url(url, next_page), len(fresh) < len(rows))
+    if cached:
+        http_cache.store(url, resp_headers, digest)
+    return page
+
+
+# --- Загрузка одной площадки ---
+async def _walk(session, site, walk, mark, limit, started, deadline, result, rows):
+    # идёт по страницам от walk["url"], пока не дойдёт до отметки. В walk копится
+    # самый свежий кортеж ("top") и следующая недочитанная страница ("url", None — дочитали);
+    # при ошибке или таймауте там остаётся страница, на которой обход прервался.
+    # deadline (time.monotonic) общий для всех страниц и хвостов площадки
+    for _ in range(SYNC_MAX_PAGES):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError
+        page = await asyncio.wait_for(_fetch_page(session, site, walk["url"], limit, mark, started, result), remaining)
+        if page is None:
+            result["unchanged"] = True
+            walk["url"] = None
+            return
+        page_rows, page_top, next_url, reached = page
+        result["pages"] += 1
+        rows.extend(page_rows)
+        if walk["top"] is None:
+            walk["top"] = page_top
+        walk["url"] = None if reached else next_url
+        if walk["url"] is None:
+            return
+
+
+async def fetch_site(session, site, limit=50):
+    # limit — на страницу: он должен быть не меньше размера страницы площадки,
+    # иначе хвост страницы пропускается и переход на следующую оставит дыру
+    name = site.get("name")
+    source = name or ""
+    result = {"site": site, "tenders": [], "elapsed": 0.0, "error": None, "unchanged": False, "pages": 0, "more": False}
+    started = time.monotonic()
+    # один бюджет времени на площадку: иначе она могла бы занять SYNC_MAX_PAGES дедлайнов
+    # на каждый курсор и пережить аренду (leases.LEASE_TTL_SECONDS)
+    deadline = started + site.get("timeout", FETCH_TIMEOUT_SECONDS)
+    mark = sync_state.get(source)
+    rows = []
+    head = {"url": site["url"], "top": None}
+    # хвосты, недочитанные раньше из-за лимита страниц или ошибки; отметка для них
+    # не годится (они старше её), поэтому идём до первого уже сохранённого тендера
+    tails = [{"url": gap, "top": None} for gap in mark["cursors"]]
+    try:
+        await _walk(session, site, head, mark, limit, started, deadline, result, rows)
+        for tail in tails:
+            await _walk(session, site, tail, {}, limit, started, deadline, result, rows)
+    except asyncio.TimeoutError:
+        result["error"] = "timeout"
+        logging.warning(f"Timeout fetching site: {name}")
+    except Exception as e:
+        result["error"] = str(e) or e.__class__.__name__
+        logging.exception(f"Error fetching site: {name}")
+    if result["error"] and head["url"] is not None:
+        # обход от головы прерван: страница не должна считаться неизменной в следующий раз
+        http_cache.unstage(site["url"])
+    # всё недочитанное — по лимиту страниц или после ошибки — остаётся курсорами, новое
+    # не вытесняет старое. Ошибка на самой первой странице курсора не даёт: ничего не прочитано
+    cursors = [w["url"] for w in [head] + tails if w["url"] and w["url"] != site["url"]]
+    if head["top"] is not None or cursors != mark["cursors"]:
+        # в БД попадёт только после сохранения тендеров (sync_state.commit)
+        sync_state.stage(source, head["top"], cursors)
+    if cursors:
+        result["more"] = True
+        logging.info(f"Site {name}: will resume from {', '.join(cursors)}")
+    # при ошибке отдаём то, что успели прочитать, а место обрыва уходит в курсоры
+    result["tenders"] = parsing.to_tenders(rows)
+    result["elapsed"] = time.monotonic() - started
+    metrics.FETCH_SECONDS.labels(source).observe(result["elapsed"])
+    if result["error"]:
+        metrics.ERRORS.labels("fetch").inc()
+    return result
+
+
+# --- Загрузка всех площадок ---
+async def fetch_sites(limit=50, sites=None):
+    session = get_session()
+    sites = [s for s in (sites if sites is not None else SITES) if s.get("url")]
+    # ETag/хэши сохранит sync_state.commit, когда тендеры будут в БД
+    return await asyncio.gather(*(fetch_site(session, s, limit) for s in sites))
+
+
+def collect(results):
+    all_tenders = []
+    unchanged = 0
+    for res in results:
+        all_tenders.extend(res["tenders"])
+        unchanged += res["unchanged"]
+    pages = sum(res["pages"] for res in results)
+    logging.info(f"Fetched {len(all_tenders)} tenders from {len(results)} platforms, {pages} pages ({unchanged} unchanged).")
+    return all_tenders
+
+
+async def fetch_tenders_async(limit=50, sites=None):
+    return collect(await fetch_sites(limit, sites))
@@ -0,0 +1,122 @@
+# http_cache.py — метаданные ответов площадок для условных запросов
+#
+# Новая запись сначала «ставится» (store), как отметки в sync_state, и
+# попадает в кэш только в sync_state.commit — после того как тендеры со
+# страницы сохранены. Иначе страница, чьи тендеры не записались в БД,
+# считалась бы неизменной, пока площадка не опубликует что-то новое.
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from storage import DB_PATH
+
+CACHE_PATH = os.path.join(os.path.dirname(DB_PATH) or ".", "http_cache.json")
+
+_lock = threading.Lock()
+_entries = None  # url -> {"etag", "last_modified", "hash"}
+_staged = {}
+_dirty = False
+
+
+def _load():
+    global _entries
+    if _entries is None:
+        try:
+            with open(CACHE_PATH, encoding="utf-8") as f:
+                _entries = json.load(f)
+        except FileNotFoundError:
+            _entries = {}
+        except Exception:
+            logging.exception("Failed to load HTTP cache, starting empty")
+            _entries = {}
+    return _entries
+
+
+def body_hash(body):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return hashlib.sha1(body).hexdigest()
+
+
+def chunks_hash(chunks):
+    # то же, что body_hash от склеенных кусков, без копии тела
+    digest = hashlib.sha1()
+    for chunk in chunks:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def request_headers(url):
+    entry = _load().get(url)
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def is_unchanged(url, status, digest=None, headers=None):
+    # 304 — сервер сам подтвердил; иначе тот же ETag или хэш тела (сервер мог проигнорировать валидаторы)
+    if status == 304:
+        return True
+    entry = _load().get(url)
+    if not entry:
+        return False
+    etag = headers.get("ETag") if headers is not None else None
+    return bool((etag and entry.get("etag") == etag) or (digest and entry.get("hash") == digest))
+
+
+def store(url, headers, digest):
+    with _lock:
+        _staged[url] = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "hash": digest,
+        }
+
+
+def unstage(url):
+    # страница прочитана, а обход площадки — нет: валидаторы не запоминаем
+    with _lock:
+        _staged.pop(url, None)
+
+
+def commit():
+    global _dirty
+    with _lock:
+        staged = dict(_staged)
+        _staged.clear()
+    if staged:
+        _load().update(staged)
+        _dirty = True
+    save()
+
+
+def discard():
+    with _lock:
+        _staged.clear()
+
+
+def save():
+    global _dirty
+    if not _dirty:
+        return
+    tmp = CACHE_PATH + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_load(), f)
+        os.replace(tmp, CACHE_PATH)
+        _dirty = False
+    except Exception:
+        logging.exception("Failed to save HTTP cache")
+
+
+def reset():
+    global _entries, _dirty
+    _entries = None
+    _dirty = False
+    discard()
@@ -0,0 +1,85 @@
+# leases.py — распределение площадок между процессами-сборщиками
+#
+# Каждый сборщик отмечается в fetch_workers и держит аренду (site_leases)
+# примерно на 1/N площадок, где N — число живых сборщиков. Аренда продлевается
+# при каждом rebalance; площадки упавшего процесса освобождаются через
+# LEASE_TTL_SECONDS и достаются остальным. Всё решается в одной пишущей
+# транзакции, поэтому два процесса не могут взять одну площадку.
+# Ручной /parse тоже идёт через БД: request_poll увеличивает номер запроса,
+# и каждый сборщик, заметив новый номер, опрашивает свои площадки сразу.
+import os
+import time
+import socket
+import logging
+
+import storage
+
+LEASE_TTL_SECONDS = float(os.getenv("LEASE_TTL_SECONDS", 300))  # дольше самого долгого опроса
+LEASE_RENEW_SECONDS = float(os.getenv("LEASE_RENEW_SECONDS", 30))  # должно быть заметно меньше TTL
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def rebalance(owner, names):
+    # -> множество площадок, которые сейчас принадлежат owner
+    now = time.time()
+    names = sorted(set(names))
+    with storage.transaction() as conn:
+        conn.execute(
+            "INSERT INTO fetch_workers (owner, heartbeat_at) VALUES (?, ?) "
+            "ON CONFLICT(owner) DO UPDATE SET heartbeat_at=excluded.heartbeat_at",
+            (owner, now)
+        )
+        conn.execute("DELETE FROM fetch_workers WHERE heartbeat_at < ?", (now - LEASE_TTL_SECONDS,))
+        alive = conn.execute("SELECT COUNT(*) FROM fetch_workers").fetchone()[0]
+        share = -(-len(names) // max(alive, 1))
+
+        held, taken = [], set()
+        for site, site_owner, expires_at in conn.execute("SELECT site, owner, expires_at FROM site_leases"):
+            if site_owner == owner and site in names:
+                held.append(site)
+            elif site_owner != owner and expires_at >= now:
+                taken.add(site)
+        held.sort()
+        released = held[share:]
+        held = held[:share]
+        if released:
+            # процессов стало больше — отдаём лишнее
+            conn.executemany("DELETE FROM site_leases WHERE site=? AND owner=?", [(s, owner) for s in released])
+        for site in names:
+            if len(held) >= share:
+                break
+            if site not in taken and site not in held:
+                held.append(site)
+        conn.executemany(
+            "INSERT INTO site_leases (site, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(site) DO UPDATE SET owner=excluded.owner, expires_at=excluded.expires_at",
+            [(site, owner, now + LEASE_TTL_SECONDS) for site in held]
+        )
+    return set(held)
+
+
+def request_poll():
+    with storage.transaction() as conn:
+        conn.execute(
+            "INSERT INTO poll_requests (id, seq, requested_at) VALUES (1, 1, ?) "
+            "ON CONFLICT(id) DO UPDATE SET seq=seq + 1, requested_at=excluded.requested_at",
+            (time.time(),)
+        )
+
+
+def poll_requested():
+    # -> номер последнего запроса опроса (0 — запросов не было)
+    with storage.connection() as conn:
+        row = conn.execute("SELECT seq FROM poll_requests WHERE id = 1").fetchone()
+    return row[0] if row else 0
+
+
+def release(owner):
+    with storage.transaction() as conn:
+        conn.execute("DELETE FROM site_leases WHERE owner=?", (owner,))
+        conn.execute("DELETE FROM fetch_workers WHERE owner=?", (owner,))
+    logging.info(f"Released site leases of {owner}")
+
@@ -0,0 +1,135 @@
+# maintenance.py — фоновое обслуживание БД: архив, чистка журналов, vacuum
+#
+# Тендеры старше TENDER_RETENTION_DAYS (по inserted_at) партиями переносятся
+# в помесячные таблицы tenders_archive_ГГГГ_ММ той же БД и уходят из tenders
+# вместе с FTS (триггер удаления); ключ (площадка, номер) остаётся в
+# archived_keys, чтобы тот же тендер не сохранился заново. Тендеры, по которым ещё ждут отправки
+# уведомления, не трогаются. Каждая партия — своя короткая транзакция, чтобы
+# не держать блокировку записи. Освободившиеся страницы возвращаются файлу
+# через incremental_vacuum понемногу, без полного VACUUM на каждом проходе.
+import os
+import re
+import logging
+from datetime import datetime, timedelta
+
+import db
+import metrics
+import storage
+
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 5000))
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", 5000))  # страниц за проход incremental_vacuum
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", 3600))
+
+ARCHIVE_COLUMNS = ("id", "purchase_number", "name", "customer", "amount", "publish_date", "source",
+                   "inserted_at", "duplicate_of")
+_MONTH = re.compile(r"\d{4}-\d{2}")
+
+
+def _before(days):
+    return (datetime.utcnow() - timedelta(days=days)).isoformat()
+
+
+def archive_table(month):
+    # "2024-01" -> tenders_archive_2024_01; имя собирается только из проверенных цифр
+    return "tenders_archive_" + (month.replace("-", "_") if _MONTH.fullmatch(month or "") else "0000_00")
+
+
+# --- Архив ---
+def _archive_month(conn, table, ids):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY,
+            purchase_number TEXT,
+            name TEXT,
+            customer TEXT,
+            amount REAL,
+            publish_date TEXT,
+            source TEXT,
+            inserted_at TEXT,
+            duplicate_of INTEGER
+        )
+    """)
+    columns = ", ".join(ARCHIVE_COLUMNS)
+    for i in range(0, len(ids), 900):
+        chunk = ids[i:i + 900]
+        marks = ",".join("?" * len(chunk))
+        conn.execute(f"INSERT OR IGNORE INTO {table} ({columns}) SELECT {columns} FROM tenders WHERE id IN ({marks})", chunk)
+        conn.execute(
+            f"INSERT OR IGNORE INTO archived_keys (purchase_number, source) "
+            f"SELECT purchase_number, source FROM tenders WHERE id IN ({marks}) AND purchase_number IS NOT NULL", chunk
+        )
+        conn.execute(f"DELETE FROM tenders WHERE id IN ({marks})", chunk)
+
+
+def archive_batch(before, limit=ARCHIVE_BATCH_SIZE):
+    # -> сколько тендеров перенесено
+    with metrics.DB_WRITE_SECONDS.labels("archive").time(), storage.transaction() as conn:
+        rows = conn.execute("""
+            SELECT id, substr(inserted_at, 1, 7) FROM tenders
+            WHERE inserted_at < ?
+              AND id NOT IN (SELECT tender_id FROM outbox WHERE status IN ('pending', 'sending'))
+            ORDER BY inserted_at
+            LIMIT ?
+        """, (before, limit)).fetchall()
+        by_month = {}
+        for tender_id, month in rows:
+            by_month.setdefault(archive_table(month), []).append(tender_id)
+        for table, ids in by_month.items():
+            _archive_month(conn, table, ids)
+        if rows:
+            conn.execute(
+                "INSERT INTO stats_counters (name, value) VALUES ('archived', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (len(rows),)
+            )
+    return len(rows)
+
+
+def archive(days=db.TENDER_RETENTION_DAYS):
+    if days <= 0:
+        return 0
+    before = _before(days)
+    total = 0
+    while True:
+        moved = archive_batch(before)
+        total += moved
+        if moved < ARCHIVE_BATCH_SIZE:
+            return total
+
+
+def prune_outbox(days=db.TENDER_RETENTION_DAYS):
+    # отправленные и окончательно неудачные уведомления старше окна хранения
+    if days <= 0:
+        return 0
+    with storage.transaction() as conn:
+        return conn.execute(
+            "DELETE FROM outbox WHERE status IN ('sent', 'failed') AND updated_at < ?", (_before(days),)
+        ).rowcount
+
+
+# --- Vacuum ---
+def vacuum(pages=VACUUM_PAGES):
+    # -> сколько свободных страниц возвращено файлу
+    with storage.connection() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # база создана до incremental-режима: один полный VACUUM его включает
+            logging.info("Switching database to incremental auto_vacuum (one-time full VACUUM)")
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            return 0
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # executescript шагает оператор до конца; execute освободил бы одну страницу
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        return free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def run():
+    # один проход обслуживания; -> итоги для лога
+    report = {
+        "archived": archive(),
+        "outbox_pruned": prune_outbox(),
+        "lsh_pruned": db.prune_near_duplicates(),
+        "log_pruned": db.prune_subscription_log(),
+    }
+    report["vacuumed_pages"] = vacuum()
+    logging.info(f"Maintenance: {report}")
+    return report
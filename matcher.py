@@ -0,0 +1,100 @@
+# matcher.py — поиск всех ключевых слов за один проход (автомат Ахо–Корасик)
+from collections import deque
+
+
+class KeywordMatcher:
+    # Префиксное дерево ключевых слов с суффиксными ссылками.
+    # add/remove меняют только дерево; ссылки пересчитываются лениво перед первым поиском.
+
+    def __init__(self, keywords=()):
+        self._goto = [{}]  # узел -> {символ: узел}
+        self._fail = [0]
+        self._dict = [0]  # ближайший по суффиксным ссылкам узел, на котором заканчивается слово
+        self._term = [None]  # ключевое слово, которое заканчивается в узле
+        self._nodes = {}  # ключевое слово -> конечный узел
+        self._dirty = False
+        for kw in keywords:
+            self.add(kw)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, keyword):
+        return keyword in self._nodes
+
+    def keywords(self):
+        return set(self._nodes)
+
+    def add(self, keyword):
+        if not keyword or keyword in self._nodes:
+            return False
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._dict.append(0)
+                self._term.append(None)
+                self._goto[node][ch] = nxt
+            node = nxt
+        self._term[node] = keyword
+        self._nodes[keyword] = node
+        self._dirty = True
+        return True
+
+    def remove(self, keyword):
+        node = self._nodes.pop(keyword, None)
+        if node is None:
+            return False
+        # узлы остаются в дереве, но перестают быть конечными
+        self._term[node] = None
+        self._dirty = True
+        return True
+
+    def sync(self, keywords):
+        # приводит автомат к заданному набору слов, трогая только разницу
+        keywords = set(keywords)
+        current = set(self._nodes)
+        for kw in current - keywords:
+            self.remove(kw)
+        for kw in keywords - current:
+            self.add(kw)
+
+    def _build(self):
+        goto, fail, dict_link, term = self._goto, self._fail, self._dict, self._term
+        queue = deque()
+        for child in goto[0].values():
+            fail[child] = 0
+            dict_link[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[child] = f
+                dict_link[child] = f if term[f] is not None else dict_link[f]
+                queue.append(child)
+        self._dirty = False
+
+    def find(self, text):
+        if self._dirty:
+            self._build()
+        goto, fail, dict_link, term = self._goto, self._fail, self._dict, self._term
+        found = set()
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if term[node] is not None:
+                found.add(term[node])
+            out = dict_link[node]
+            while out:
+                found.add(term[out])
+                out = dict_link[out]
+        return found
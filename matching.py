@@ -0,0 +1,72 @@
+# matching.py — сопоставление новых тендеров с подписками
+#
+# Новые тендеры берутся из БД по курсору match_cursor, а не из памяти процесса,
+# который их скачал: так сопоставлением может заниматься отдельный процесс
+# (workers.py match). Пары пишутся в outbox в одной транзакции со сдвигом
+# курсора, поэтому после падения ничего не теряется и не дублируется.
+# Копия тендера с другой площадки (duplicate_of, см. neardup.py) уходит
+# только тем, кому не ушёл оригинал, — например, подписчикам с фильтром
+# по площадке копии.
+import os
+import logging
+
+import db
+import metrics
+import outbox
+import storage
+import subscriptions
+from models import Tender
+
+MATCH_BATCH_SIZE = int(os.getenv("MATCH_BATCH_SIZE", 1000))  # тендеров за один проход
+MATCH_CURSOR = "match"
+
+
+def match_pairs(tenders):
+    # (user_id, tender_id) для всех подписчиков, чьи правила подходят к тендеру
+    pairs = set()
+    with metrics.MATCH_SECONDS.time():
+        for t in tenders:
+            for u in subscriptions.match_tender(t):
+                pairs.add((u, t.id))
+    return pairs
+
+
+def skip_duplicates(conn, pairs, originals):
+    # originals — {id копии: id оригинала}; -> пары без копий, чей оригинал пользователь уже получает
+    if not originals:
+        return pairs
+    kept = set()
+    for user_id, tender_id in pairs:
+        original = originals.get(tender_id)
+        if original is not None and ((user_id, original) in pairs or conn.execute(
+            "SELECT 1 FROM outbox WHERE user_id=? AND tender_id=?", (user_id, original)
+        ).fetchone()):
+            continue
+        kept.add((user_id, tender_id))
+    metrics.DUPLICATES.labels("notify").inc(len(pairs) - len(kept))
+    return kept
+
+
+def match_new(limit=MATCH_BATCH_SIZE):
+    # -> (сколько тендеров обработано, сколько уведомлений поставлено)
+    db.sync_subscriptions()
+    with storage.connection() as conn:
+        last_id = conn.execute("SELECT last_id FROM match_cursor WHERE name=?", (MATCH_CURSOR,)).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {', '.join(db.TENDER_COLUMNS)}, duplicate_of FROM tenders WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, limit)
+        ).fetchall()
+    if not rows:
+        return 0, 0
+    originals = {row[0]: row[-1] for row in rows if row[-1] is not None}
+    pairs = match_pairs(Tender.from_db(row[:-1]) for row in rows)
+    with metrics.DB_WRITE_SECONDS.labels("outbox").time(), storage.transaction() as conn:
+        # compare-and-set: если курсор уже сдвинул другой процесс, эту партию не пишем
+        moved = conn.execute(
+            "UPDATE match_cursor SET last_id=? WHERE name=? AND last_id=?", (rows[-1][0], MATCH_CURSOR, last_id)
+        ).rowcount
+        queued = outbox.insert(conn, skip_duplicates(conn, pairs, originals)) if moved else 0
+    if not moved:
+        return 0, 0
+    logging.info(f"Matched {len(rows)} tenders, queued {queued} notifications.")
+    return len(rows), queued
@@ -0,0 +1,205 @@
+# metrics.py — метрики в текстовом формате Prometheus для /metrics
+#
+# Счётчики, gauge и гистограммы без внешних зависимостей. Запись метрики —
+# это прибавление к числу под общей блокировкой; текст собирается только
+# при запросе /metrics, а gauge с функцией вычисляются тоже только тогда.
+import time
+import bisect
+import asyncio
+import threading
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+_lock = threading.Lock()  # значения меняются и из потоков БД
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children = {}
+        if not self.labelnames:
+            self.labels()  # чтобы метрика без меток сразу отдавалась нулём
+        _registry.append(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with _lock:
+                child = self._children.setdefault(key, self._child())
+        return child
+
+    def _default(self):
+        # метрика без меток сама ведёт себя как своё единственное значение
+        return self.labels()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._samples(key, child))
+        return lines
+
+
+# --- Counter ---
+class _CounterValue:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        with _lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _child = _CounterValue
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def _samples(self, key, child):
+        yield f"{self.name}{_labels(self.labelnames, key)} {_number(child.value)}"
+
+
+# --- Gauge ---
+class _GaugeValue:
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with _lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set_function(self, function):
+        # значение считается в момент запроса /metrics
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    _child = _GaugeValue
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+    def _samples(self, key, child):
+        yield f"{self.name}{_labels(self.labelnames, key)} {_number(child.get())}"
+
+
+# --- Histogram ---
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний — +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+    def _samples(self, key, child):
+        with _lock:
+            counts = list(child.counts)
+            total = child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_number(bound)}"'
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+        yield f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}"
+        yield f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}"
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Метрики бота ---
+FETCH_SECONDS = Histogram("tenderbot_fetch_seconds", "Time to fetch and parse one site", ("site",))
+PARSE_SECONDS = Histogram("tenderbot_parse_seconds", "Time to parse one downloaded page", ("type",))
+DB_WRITE_SECONDS = Histogram("tenderbot_db_write_seconds", "Time spent in DB write transactions", ("table",))
+MATCH_SECONDS = Histogram("tenderbot_match_seconds", "Time to match new tenders against subscriptions")
+SEND_SECONDS = Histogram("tenderbot_send_seconds", "Telegram send_message latency")
+CYCLE_SECONDS = Histogram("tenderbot_cycle_seconds", "Fetch-and-ingest cycle time", buckets=(1, 2.5, 5, 10, 30, 60, 120, 300))
+TENDERS_NEW = Counter("tenderbot_tenders_new_total", "New tenders stored", ("source",))
+DUPLICATES = Counter("tenderbot_duplicates_total", "Tenders dropped as already known", ("stage",))
+ERRORS = Counter("tenderbot_errors_total", "Errors by pipeline stage", ("stage",))
+FLOOD_WAITS = Counter("tenderbot_flood_waits_total", "Telegram flood-wait responses")
+QUEUE_DEPTH = Gauge("tenderbot_queue_depth", "Items waiting in a queue", ("queue",))
+LOOP_LAG = Gauge("tenderbot_event_loop_lag_seconds", "Event loop scheduling delay")
+SEEN_BYTES = Gauge("tenderbot_seen_set_bytes", "Memory held by the dedup seen-set", ("layer",))
+SEEN_FP_RATE = Gauge("tenderbot_seen_set_fp_rate", "Estimated false-positive rate of the seen-set Bloom filter")
+
+
+async def watch_loop_lag(interval=1.0):
+    # насколько позже запланированного просыпается цикл событий
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        LOOP_LAG.set(max(0.0, time.monotonic() - started - interval))
@@ -0,0 +1,113 @@
+# models.py — тендер как компактная запись с уже нормализованными полями
+#
+# Tender создаётся один раз — из кортежа разбора (parsing.FIELDS) или из
+# строки БД — и дальше идёт по конвейеру без пересборки: номер — строка,
+# сумма — float, дата — datetime (или None), название для сопоставления
+# уже в нижнем регистре. Дату, которую не удалось разобрать, не теряем:
+# её исходный текст хранится в raw_date и уходит в БД и в уведомление.
+# __slots__ вместо словаря на каждый тендер.
+import re
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+_DOTTED = re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?")
+# число внутри строки с валютой: «12 тг», «₸ 1 500», «KZT 1,500.00»
+_NUMBER = re.compile(r"-?\d[\d\s.,']*")
+
+
+def parse_amount(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        return 0.0
+    # «1 500 000,00 тг» с казахстанских страниц, «1,500,000.00» из API, «1.500.000,00»
+    found = _NUMBER.search(str(value))
+    if not found:
+        return 0.0
+    text = re.sub(r"[\s']", "", found.group()).rstrip(".,")
+    last = max(text.rfind("."), text.rfind(","))
+    if last >= 0:
+        sep = text[last]
+        # последний разделитель — десятичный, если есть оба вида или он один и за ним не ровно 3 цифры;
+        # иначе это разделитель тысяч: «1,500», «1.500.000»
+        decimal = ("." in text and "," in text) or (text.count(sep) == 1 and len(text) - last - 1 != 3)
+        whole = text[:last] if decimal else text
+        text = re.sub(r"[.,]", "", whole) + ("." + text[last + 1:] if decimal else "")
+    try:
+        return float(text)
+    except ValueError:
+        return 0.0
+
+
+def parse_date(value):
+    # ISO 8601 (API), RFC 822 (pubDate в RSS), ДД.ММ.ГГГГ [ЧЧ:ММ[:СС]];
+    # -> datetime без часового пояса (в UTC, если пояс был указан) или None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        text = str(value or "").strip()
+        if not text:
+            return None
+        try:
+            dt = datetime.fromisoformat(text)
+        except ValueError:
+            m = _DOTTED.fullmatch(text)
+            try:
+                if m:
+                    day, month, year, hour, minute, second = (int(g or 0) for g in m.groups())
+                    dt = datetime(year, month, day, hour, minute, second)
+                else:
+                    dt = parsedate_to_datetime(text)
+            except (TypeError, ValueError, IndexError):
+                return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def read_date(value):
+    # для кортежей разбора: datetime, а если разобрать не удалось — исходный текст (или None)
+    dt = parse_date(value)
+    if dt is None and value is not None:
+        return str(value).strip() or None
+    return dt
+
+
+def format_date(dt):
+    return dt.isoformat(timespec="seconds") if dt is not None else ""
+
+
+class Tender:
+    __slots__ = ("id", "purchase_number", "name", "customer", "amount", "published", "raw_date", "source", "name_lower")
+
+    def __init__(self, purchase_number, name="", customer="", amount=0.0, published=None, source="", id=None):
+        self.id = id
+        self.purchase_number = "" if purchase_number is None else str(purchase_number)
+        self.name = name or ""
+        self.customer = customer or ""
+        self.amount = parse_amount(amount)
+        self.published = parse_date(published)
+        self.raw_date = str(published).strip() if self.published is None and published is not None else ""
+        self.source = source or ""
+        self.name_lower = self.name.lower()
+
+    @classmethod
+    def from_row(cls, row):
+        # кортеж в порядке parsing.FIELDS
+        return cls(*row)
+
+    @classmethod
+    def from_db(cls, row):
+        # строка в порядке db.TENDER_COLUMNS
+        tender_id, purchase_number, name, customer, amount, publish_date, source = row
+        return cls(purchase_number, name, customer, amount, publish_date, source, tender_id)
+
+    @property
+    def publish_date(self):
+        return format_date(self.published) or self.raw_date
+
+    def db_row(self):
+        return (self.purchase_number, self.name, self.customer, self.amount, self.publish_date, self.source)
+
+    def __repr__(self):
+        return f"Tender({self.source!r}, {self.purchase_number!r}, {self.name!r})"
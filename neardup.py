@@ -0,0 +1,117 @@
+# neardup.py — почти-дубликаты одного тендера с разных площадок (MinHash + LSH)
+#
+# Одна закупка приходит с goszakup, из RSS-агрегатора и со страницы Tender.kz
+# под разными purchase_number, поэтому UNIQUE её не ловит. Для каждого нового
+# тендера считается MinHash-подпись по словам и парам слов нормализованного
+# названия (rules.normalize), подпись режется на NEARDUP_BANDS полос, и хэши
+# полос лежат в tender_lsh. Кандидаты — тендеры, совпавшие хотя бы по одной
+# полосе (несколько запросов по индексу вместо сравнения со всей историей);
+# дубликатом кандидат считается, если он с другой площадки, сходство названий
+# не ниже NEARDUP_THRESHOLD, а заказчик и сумма не противоречат друг другу.
+# В индекс попадают только оригиналы: копия сравнивается с ними напрямую,
+# а не через другую копию, у которой могло не быть заказчика и суммы.
+# Заказчик и сумма — проверка, а не часть подписи: у HTML- и RSS-копий их
+# обычно нет, и подпись с ними как раз разошлась бы у тех копий, что ищем.
+import os
+import re
+import zlib
+import random
+import struct
+import logging
+from datetime import datetime, timedelta
+
+import rules
+
+NEARDUP_THRESHOLD = float(os.getenv("NEARDUP_THRESHOLD", 0.7))  # сходство Жаккара по названию
+NEARDUP_WINDOW_DAYS = int(os.getenv("NEARDUP_WINDOW_DAYS", 30))  # с какой историей сравниваем
+NEARDUP_MIN_WORDS = int(os.getenv("NEARDUP_MIN_WORDS", 4))  # короткие названия («Услуги охраны») не сравниваем
+NEARDUP_BANDS = 8
+NEARDUP_ROWS = 4  # порог срабатывания LSH ~ (1/8)^(1/4) ≈ 0.6
+AMOUNT_TOLERANCE = 0.01
+_UNIT = re.compile(r"(\d)(?=[^\W\d_])")  # «100мм» -> «100 мм»
+
+_PRIME = (1 << 61) - 1
+# коэффициенты фиксированы: подписи хранятся в БД и должны совпадать между процессами и рестартами
+_rnd = random.Random(20240101)
+_PERMUTATIONS = [(_rnd.randrange(1, _PRIME), _rnd.randrange(0, _PRIME)) for _ in range(NEARDUP_BANDS * NEARDUP_ROWS)]
+
+
+# --- Подписи ---
+def shingles(name):
+    words = rules.normalize(_UNIT.sub(r"\1 ", name.lower())).split()
+    if len(words) < NEARDUP_MIN_WORDS:
+        return set()
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def signature(items):
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in items]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def buckets(sig):
+    # номер полосы в старших битах, чтобы одинаковые значения разных полос не склеивались
+    result = []
+    for band in range(NEARDUP_BANDS):
+        chunk = sig[band * NEARDUP_ROWS:(band + 1) * NEARDUP_ROWS]
+        result.append((band << 32) | zlib.crc32(struct.pack(f"{NEARDUP_ROWS}Q", *chunk)))
+    return result
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def _compatible(t, customer, amount):
+    # пустые поля ничего не опровергают
+    if t.amount and amount and abs(t.amount - amount) > AMOUNT_TOLERANCE * max(t.amount, amount):
+        return False
+    if t.customer and customer:
+        mine = set(rules.normalize(t.customer.lower()).split())
+        theirs = set(rules.normalize(customer.lower()).split())
+        if _jaccard(mine, theirs) < 0.5:
+            return False
+    return True
+
+
+# --- Разметка ---
+def mark(conn, tenders):
+    # tenders — только что вставленные models.Tender с id, внутри транзакции сохранения;
+    # -> {id дубликата: id оригинала}
+    duplicates = {}
+    for t in sorted(tenders, key=lambda t: t.id):
+        items = shingles(t.name)
+        if not items:
+            continue
+        keys = buckets(signature(items))
+        marks = ",".join("?" * len(keys))
+        candidates = conn.execute(f"""
+            SELECT t.id, t.name, t.customer, t.amount, t.source
+            FROM tenders t WHERE t.id IN (SELECT DISTINCT tender_id FROM tender_lsh WHERE bucket IN ({marks}))
+            ORDER BY t.id
+        """, keys).fetchall()
+        for cand_id, name, customer, amount, source in candidates:
+            if source == t.source or not _compatible(t, customer, amount):
+                continue
+            if _jaccard(items, shingles(name or "")) >= NEARDUP_THRESHOLD:
+                duplicates[t.id] = cand_id
+                break
+        else:
+            conn.executemany(
+                "INSERT OR IGNORE INTO tender_lsh (bucket, tender_id) VALUES (?, ?)", [(k, t.id) for k in keys]
+            )
+    if duplicates:
+        conn.executemany("UPDATE tenders SET duplicate_of=? WHERE id=?", [(o, d) for d, o in duplicates.items()])
+    return duplicates
+
+
+def prune(conn, days=NEARDUP_WINDOW_DAYS):
+    # из индекса уходят тендеры старше окна; сами тендеры остаются
+    since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    first = conn.execute("SELECT MIN(id) FROM tenders WHERE inserted_at >= ?", (since,)).fetchone()[0]
+    if first is None:
+        first = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM tenders").fetchone()[0]
+    removed = conn.execute("DELETE FROM tender_lsh WHERE tender_id < ?", (first,)).rowcount
+    if removed:
+        logging.info(f"Near-dup index: pruned {removed} buckets older than {days} days")
+    return removed
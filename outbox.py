@@ -0,0 +1,185 @@
+# outbox.py — очередь уведомлений в SQLite (user_id, tender_id, status, attempts)
+#
+# Сопоставление пишет пары пачкой, отправитель забирает их партиями.
+# Статусы: pending -> sending -> sent | failed. Все переходы условные,
+# поэтому повторный вызов mark_* ничего не ломает, а после рестарта
+# зависшие в sending строки возвращаются в pending.
+#
+# Режим доставки (user_settings): instant — строка готова к отправке сразу,
+# hourly и daily — due_at ставится на ближайшую границу часа или на
+# DIGEST_HOUR_UTC, и до этого срока строка лежит в pending. К сроку все
+# накопленные строки пользователя забираются вместе и уходят одной подборкой.
+import os
+import logging
+from datetime import datetime, timedelta
+
+import metrics
+import storage
+from models import Tender
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 500))  # сообщений в очереди отправки, после которых партии не берём
+OUTBOX_BATCH_USERS = int(os.getenv("OUTBOX_BATCH_USERS", 100))  # получателей в одной партии, со всеми их строками
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 3))
+OUTBOX_RETRY_SECONDS = int(os.getenv("OUTBOX_RETRY_SECONDS", 60))  # пауза перед повтором, удваивается с каждой попыткой
+DIGEST_HOUR_UTC = int(os.getenv("DIGEST_HOUR_UTC", 4))  # ежедневная подборка в 09:00 по Астане (UTC+5)
+DELIVERY_MODES = ("instant", "hourly", "daily")
+
+
+# --- Режим доставки ---
+def due_at(mode, now):
+    if mode == "hourly":
+        return now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    if mode == "daily":
+        due = now.replace(hour=DIGEST_HOUR_UTC, minute=0, second=0, microsecond=0)
+        return due if due > now else due + timedelta(days=1)
+    return now
+
+
+def delivery_mode(user_id: int):
+    with storage.connection() as conn:
+        row = conn.execute("SELECT delivery_mode FROM user_settings WHERE user_id=?", (user_id,)).fetchone()
+    return row[0] if row else "instant"
+
+
+def set_delivery_mode(user_id: int, mode: str):
+    # уже накопленное переносится на срок нового режима: при переходе на instant уходит сразу;
+    # -> сколько ожидающих уведомлений перенесено
+    if mode not in DELIVERY_MODES:
+        raise ValueError(f"unknown delivery mode {mode!r}")
+    now = datetime.utcnow()
+    with storage.transaction() as conn:
+        conn.execute(
+            "INSERT INTO user_settings (user_id, delivery_mode, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET delivery_mode=excluded.delivery_mode, updated_at=excluded.updated_at",
+            (user_id, mode, now.isoformat())
+        )
+        return conn.execute(
+            "UPDATE outbox SET due_at=? WHERE user_id=? AND status='pending'", (due_at(mode, now).isoformat(), user_id)
+        ).rowcount
+
+
+# --- Очередь ---
+def insert(conn, pairs):
+    # внутри чужой транзакции (например, вместе со сдвигом курсора сопоставления)
+    now = datetime.utcnow()
+    stamp = now.isoformat()
+    # пользователей с дайджестом немного — берём их всех, а не ищем каждого получателя
+    held = {
+        user_id: due_at(mode, now).isoformat()
+        for user_id, mode in conn.execute("SELECT user_id, delivery_mode FROM user_settings WHERE delivery_mode != 'instant'")
+    }
+    before = conn.total_changes
+    # строки одного пользователя идут подряд по id — и в claim_batch, и в файле БД
+    conn.executemany(
+        "INSERT OR IGNORE INTO outbox (user_id, tender_id, created_at, updated_at, due_at) VALUES (?, ?, ?, ?, ?)",
+        [(user_id, tender_id, stamp, stamp, held.get(user_id, stamp)) for user_id, tender_id in sorted(pairs)]
+    )
+    return conn.total_changes - before
+
+
+def add(pairs):
+    # pairs — (user_id, tender_id); уже существующие пары игнорируются
+    pairs = list(pairs)
+    if not pairs:
+        return 0
+    with metrics.DB_WRITE_SECONDS.labels("outbox").time(), storage.transaction() as conn:
+        added = insert(conn, pairs)
+    logging.info(f"Outbox: queued {added} notifications.")
+    return added
+
+
+def _due_users(conn, now, limit):
+    # первые limit получателей в порядке срока их самой ранней строки
+    users = []
+    seen = set()
+    cur = conn.execute("SELECT user_id FROM outbox WHERE status='pending' AND due_at <= ? ORDER BY due_at, id", (now,))
+    for (user_id,) in cur:
+        if user_id not in seen:
+            seen.add(user_id)
+            users.append(user_id)
+            if len(users) >= limit:
+                break
+    cur.close()
+    return users
+
+
+def claim_batch(users_limit=OUTBOX_BATCH_USERS):
+    # переводит в sending все строки pending, чей срок наступил, у следующих users_limit получателей,
+    # и возвращает их вместе с данными тендеров: пользователь получает всё накопленное одной пачкой;
+    # -> [(outbox_id, user_id, Tender, held)], held — строка ждала подборки, а не шла сразу
+    # (у повторов после неудачи due_at сдвинут паузой, поэтому подборкой считается только первая попытка)
+    now = datetime.utcnow().isoformat()
+    with storage.connection() as conn:
+        users = _due_users(conn, now, users_limit)
+        if not users:
+            return []
+        claimed = []
+        with conn:
+            cur = conn.cursor()
+            for i in range(0, len(users), 900):
+                chunk = users[i:i + 900]
+                cur.execute(f"""
+                    UPDATE outbox SET status='sending', attempts=attempts+1, updated_at=?
+                    WHERE status='pending' AND due_at <= ? AND user_id IN ({','.join('?' * len(chunk))})
+                    RETURNING id, user_id, tender_id, attempts = 1 AND due_at > created_at
+                """, (now, now, *chunk))
+                claimed.extend(cur.fetchall())
+        if not claimed:
+            return []
+        tender_ids = sorted({tender_id for _, _, tender_id, _ in claimed})
+        tenders = {}
+        for i in range(0, len(tender_ids), 900):
+            chunk = tender_ids[i:i + 900]
+            cur.execute(
+                "SELECT id, purchase_number, name, customer, amount, publish_date, source FROM tenders "
+                f"WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for row in cur.fetchall():
+                tenders[row[0]] = Tender.from_db(row)
+    claimed.sort()
+    return [(outbox_id, user_id, tenders.get(tender_id), bool(held)) for outbox_id, user_id, tender_id, held in claimed]
+
+
+def _update(sql, ids, *params):
+    ids = list(ids)
+    if not ids:
+        return 0
+    now = datetime.utcnow().isoformat()
+    changed = 0
+    with storage.transaction() as conn:
+        for i in range(0, len(ids), 900):
+            chunk = ids[i:i + 900]
+            cur = conn.execute(
+                sql.format(ids=",".join("?" * len(chunk))), (now, *params, *chunk)
+            )
+            changed += cur.rowcount
+    return changed
+
+
+def mark_sent(ids):
+    return _update("UPDATE outbox SET status='sent', updated_at=? WHERE status='sending' AND id IN ({ids})", ids)
+
+
+def mark_failed(ids):
+    # вернуть в pending для повтора или окончательно пометить failed; повтор — не раньше
+    # чем через OUTBOX_RETRY_SECONDS × 2^(попытка-1), иначе строку заберут в ту же секунду
+    return _update(
+        "UPDATE outbox SET updated_at=?, status=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+        "due_at=strftime('%Y-%m-%dT%H:%M:%f', ?1, '+' || (? << min(attempts - 1, 10)) || ' seconds') "
+        "WHERE status='sending' AND id IN ({ids})",
+        ids, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_SECONDS
+    )
+
+
+def release_in_flight():
+    # после рестарта: всё, что не успели отправить, снова в очередь
+    with storage.transaction() as conn:
+        released = conn.execute("UPDATE outbox SET status='pending' WHERE status='sending'").rowcount
+    if released:
+        logging.info(f"Outbox: released {released} in-flight notifications.")
+    return released
+
+
+def pending_count():
+    with storage.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM outbox WHERE status='pending'").fetchone()[0]
@@ -0,0 +1,180 @@
+# parsing.py — разбор скачанных страниц в пуле процессов через lxml
+#
+# Воркеры получают сырые байты и возвращают компактные кортежи
+# (purchase_number, name, customer, amount, published, source) с уже
+# разобранными суммой и датой (нераспознанная дата остаётся строкой) и ссылку на следующую страницу, если площадка
+# её отдаёт; models.Tender собираются в основном процессе и только для новых.
+import os
+import json
+import asyncio
+import logging
+import multiprocessing
+from io import BytesIO
+from urllib.parse import urljoin
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import lxml.html
+from lxml import etree
+from lxml.cssselect import CSSSelector
+
+import metrics
+from models import Tender, parse_amount, read_date
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", min(4, os.cpu_count() or 1)))  # 0 — разбирать в потоке
+FIELDS = ("purchase_number", "name", "customer", "amount", "published", "source")
+
+_pool = None
+
+
+# --- Разбор (выполняется в воркере) ---
+@lru_cache(maxsize=None)
+def compiled_selector(css):
+    # селектор компилируется один раз на воркер для каждой площадки
+    return CSSSelector(css)
+
+
+def json_row(item, source):
+    return (
+        item.get("id") or item.get("purchase_number"),
+        item.get("title") or item.get("name"),
+        item.get("ref_customer_name_ru") or item.get("customer"),
+        parse_amount(item.get("amount")),
+        read_date(item.get("date") or item.get("publish_date")),
+        source,
+    )
+
+
+def json_page(data):
+    # список тендеров и ссылка на следующую страницу: голый массив
+    # или объект вида {"items": [...], "next_page": "..."} (API goszakup)
+    if isinstance(data, list):
+        return data, None
+    if isinstance(data, dict):
+        items = data.get("items")
+        return (items if isinstance(items, list) else []), data.get("next_page") or data.get("next")
+    return [], None
+
+
+def parse_json(raw, limit, source):
+    items, next_page = json_page(json.loads(raw))
+    return [json_row(item, source) for item in items[:limit] if isinstance(item, dict)], next_page
+
+
+def parse_html(raw, encoding, selector, limit, source):
+    if not selector:
+        return [], None
+    doc = lxml.html.document_fromstring(raw.decode(encoding or "utf-8", errors="replace"))
+    rows = []
+    for el in compiled_selector(selector)(doc)[:limit]:
+        name = " ".join(el.text_content().split())
+        rows.append((el.get("href") or name, name, "", 0.0, None, source))
+    next_page = doc.xpath('string((//link[@rel="next"] | //a[@rel="next"])[1]/@href)') or None
+    return rows, next_page
+
+
+def _iter_elements(raw, tag, limit):
+    # iterparse с очисткой уже разобранных элементов: дерево целиком не строится
+    count = 0
+    for _, el in etree.iterparse(BytesIO(raw), events=("end",), tag=tag, recover=True, huge_tree=True):
+        yield el
+        el.clear(keep_tail=True)
+        count += 1
+        if count >= limit:
+            break
+
+
+def xml_row(el, source):
+    return (
+        el.findtext("{*}id") or "",
+        el.findtext("{*}title") or "",
+        el.findtext("{*}customer") or "",
+        parse_amount(el.findtext("{*}amount")),
+        read_date(el.findtext("{*}date")),
+        source,
+    )
+
+
+def rss_row(el, source):
+    name = el.findtext("{*}title") or ""
+    return (el.findtext("{*}link") or name, name, "", 0.0, read_date(el.findtext("{*}pubDate")), source)
+
+
+def parse_xml(raw, limit, source):
+    return [xml_row(el, source) for el in _iter_elements(raw, "{*}tender", limit)], None
+
+
+def parse_rss(raw, limit, source):
+    return [rss_row(el, source) for el in _iter_elements(raw, "{*}item", limit)], None
+
+
+def parse_document(site_type, selector, raw, encoding, limit, source):
+    # -> (кортежи тендеров, ссылка на следующую страницу или None)
+    if not raw:
+        return [], None
+    if site_type == "json":
+        return parse_json(raw, limit, source)
+    if site_type == "html":
+        return parse_html(raw, encoding, selector, limit, source)
+    if site_type == "xml":
+        return parse_xml(raw, limit, source)
+    if site_type == "rss":
+        return parse_rss(raw, limit, source)
+    return [], None
+
+
+# --- Пул процессов ---
+def _context():
+    # пул создаётся лениво, когда в процессе уже работают потоки (пул БД, aiohttp,
+    # ранний HTTP-сервер): fork скопировал бы в воркер захваченные ими блокировки.
+    # forkserver порождает воркеры из чистого однопоточного процесса, где этот модуль
+    # с lxml уже импортирован. Главный модуль воркер импортирует сам, под именем
+    # __mp_main__, так что его блок if __name__ == "__main__" не выполняется
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload([__name__])
+    return context
+
+
+def get_pool():
+    global _pool
+    if _pool is None and PARSE_WORKERS > 0:
+        _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=_context())
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def next_url(base, next_page):
+    return urljoin(base, next_page) if next_page else None
+
+
+async def parse(site, raw, encoding, limit=50):
+    loop = asyncio.get_running_loop()
+    args = (site.get("type"), site.get("selector"), raw, encoding, limit, site.get("name") or "")
+    with metrics.PARSE_SECONDS.labels(site.get("type")).time():
+        try:
+            return await loop.run_in_executor(get_pool(), parse_document, *args)
+        except BrokenProcessPool:
+            # воркер упал (например, OOM) — пересоздаём пул и разбираем в потоке
+            logging.exception("Parse pool is broken, recreating")
+            metrics.ERRORS.labels("parse").inc()
+            shutdown()
+            return await loop.run_in_executor(None, parse_document, *args)
+
+
+def to_tenders(rows, seen=None):
+    # уже виденные тендеры отбрасываются до того, как для них строится Tender
+    tenders = []
+    for row in rows:
+        if seen is not None and seen(row[5], row[0]):
+            continue
+        tenders.append(Tender.from_row(row))
+    return tenders
@@ -0,0 +1,199 @@
+# rules.py — подписки с опциями и нормализация текста для сопоставления
+#
+# Подписка по-прежнему хранится одной строкой (subscriptions.keyword),
+# в каноническом виде:
+#   трубы стальные [где:заказчик|везде] [сумма:ОТ-ДО] [площадка:имя,имя] [формы]
+# Без опций это обычное ключевое слово и прежний поиск подстроки, так что
+# подписки, сохранённые раньше, ведут себя как прежде. Опция «формы»
+# включает лёгкую нормализацию: нижний регистр, ё -> е, у русских слов
+# отбрасывается окончание, у казахских — аффиксы множественного числа,
+# падежа и принадлежности. Так «трубы формы» находит и «труб», и «трубами».
+# Основа ищется только с начала слова, а короткая (газ, сет) — только как
+# слово целиком: иначе «газы» находили бы «газету», а «сети» — «посетителей».
+import re
+
+from models import parse_amount
+
+MIN_STEM = 3  # короче не обрезаем: «газы» -> «газ», но «ели» остаётся
+WHOLE_WORD_STEM = 5  # основа короче ищется только как слово целиком
+
+_WORD = re.compile(r"\w+")
+_KAZAKH = re.compile(r"[әғқңөұүһі]")
+# длинные окончания раньше коротких
+_RU_ENDINGS = sorted("""
+    иями ями ами ием ией иям иях ию ии ого его ому ему ыми ими ее ие ые ое ая яя ую юю ый ий ой ых их ым им ей ом ем
+    ам ям ах ях ов ев ью ия а я о е ы и у ю ь й
+""".split(), key=len, reverse=True)
+_KZ_SUFFIXES = sorted("""
+    лар лер дар дер тар тер ның нің дың дің тың тің дан ден тан тен нан нен нда нде
+    ға ге қа ке на не да де та те ды ді ты ті ны ні сы сі ы і
+""".split(), key=len, reverse=True)
+
+FIELDS = {"название": "name", "name": "name", "заказчик": "customer", "customer": "customer",
+          "везде": "any", "any": "any"}
+FIELD_NAMES = {"name": "название", "customer": "заказчик", "any": "везде"}
+OPTIONS = {"где": "field", "field": "field", "сумма": "amount", "amount": "amount",
+           "площадка": "source", "source": "source"}
+STEM_FLAGS = ("формы", "forms")
+EXACT_FLAGS = ("точно", "exact")  # поиск подстроки и так по умолчанию; флаг понимаем ради старых правил
+_MULTIPLIERS = (("млн", 1e6), ("m", 1e6), ("м", 1e6), ("тыс", 1e3), ("k", 1e3), ("к", 1e3))
+
+
+# --- Нормализация ---
+def _strip(word, suffixes):
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def stem(word):
+    if _KAZAKH.search(word):
+        # агглютинация: аффиксов может быть несколько подряд
+        for _ in range(3):
+            shorter = _strip(word, _KZ_SUFFIXES)
+            if shorter == word:
+                break
+            word = shorter
+        return word
+    return _strip(word, _RU_ENDINGS)
+
+
+def normalize(text):
+    # текст -> основы слов через пробел; text уже в нижнем регистре
+    return " ".join(stem(w) for w in _WORD.findall(text.replace("ё", "е")))
+
+
+def words(text):
+    # нормализованный текст с пробелами по краям: в нём « основа» — начало слова
+    return f" {normalize(text)} "
+
+
+# --- Правило подписки ---
+class Rule:
+    __slots__ = ("text", "pattern", "needle", "exact", "field", "min_amount", "max_amount", "sources", "spec")
+
+    def __init__(self, text, exact=True, field="name", min_amount=None, max_amount=None, sources=()):
+        self.text = text
+        self.exact = exact
+        self.pattern = text if exact else normalize(text)
+        self.needle = self.pattern if exact else _needle(self.pattern)
+        self.field = field
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.sources = tuple(sorted(set(sources)))
+        self.spec = self._spec()
+
+    def _spec(self):
+        parts = [self.text]
+        if self.field != "name":
+            parts.append(f"где:{FIELD_NAMES[self.field]}")
+        if self.min_amount is not None or self.max_amount is not None:
+            parts.append(f"сумма:{_number(self.min_amount)}-{_number(self.max_amount)}")
+        if self.sources:
+            parts.append("площадка:" + ",".join(self.sources))
+        if not self.exact:
+            parts.append(STEM_FLAGS[0])
+        return " ".join(parts)
+
+    def accepts(self, t):
+        # фильтры помимо текста; тендер без суммы под ограничение по сумме не подходит
+        if self.min_amount is not None and not (t.amount and t.amount >= self.min_amount):
+            return False
+        if self.max_amount is not None and not (t.amount and t.amount <= self.max_amount):
+            return False
+        if self.sources:
+            source = t.source.lower()
+            if not any(s in source for s in self.sources):
+                return False
+        return True
+
+    def texts(self, t):
+        if self.field == "name":
+            texts = (t.name_lower,)
+        elif self.field == "customer":
+            texts = (t.customer.lower(),)
+        else:
+            texts = (t.name_lower, t.customer.lower())
+        return texts if self.exact else tuple(words(x) for x in texts)
+
+    def matches(self, t):
+        # проверка одного тендера целиком; массовое сопоставление идёт через subscriptions.match_tender
+        return any(self.needle in x for x in self.texts(t)) and self.accepts(t)
+
+    def fts_column(self):
+        return None if self.field == "any" else self.field
+
+
+def _needle(pattern):
+    # что искать в words(текст): с начала слова, короткая последняя основа — до конца слова
+    if not pattern:
+        return ""
+    last = pattern.rsplit(" ", 1)[-1]
+    return f" {pattern} " if len(last) < WHOLE_WORD_STEM else f" {pattern}"
+
+
+def _number(value):
+    if value is None:
+        return ""
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _amount(value):
+    value = value.strip().lower()
+    if not value:
+        return None
+    for suffix, factor in _MULTIPLIERS:
+        if value.endswith(suffix):
+            number = value[:-len(suffix)]
+            break
+    else:
+        number, factor = value, 1
+    if not re.fullmatch(r"[\d\s.,]+", number):
+        raise ValueError(f"не понял сумму «{value}»")
+    return parse_amount(number) * factor
+
+
+def parse(spec):
+    # строка пользователя или из БД -> Rule; ошибки — ValueError с текстом для пользователя
+    words = []
+    options = {}
+    exact = True
+    for token in spec.split():
+        key, sep, value = token.partition(":")
+        option = OPTIONS.get(key.lower()) if sep else None
+        if option:
+            options[option] = value
+        elif token.lower() in STEM_FLAGS:
+            exact = False
+        elif token.lower() in EXACT_FLAGS:
+            pass
+        else:
+            words.append(token)
+    text = " ".join(words).lower()
+    if not text:
+        raise ValueError("ключевое слово пустое")
+
+    field = "name"
+    if "field" in options:
+        field = FIELDS.get(options["field"].lower())
+        if field is None:
+            raise ValueError("где: бывает название, заказчик или везде")
+    min_amount = max_amount = None
+    if "amount" in options:
+        low, sep, high = options["amount"].partition("-")
+        min_amount = _amount(low)
+        max_amount = _amount(high) if sep else None
+        if min_amount is not None and max_amount is not None and min_amount > max_amount:
+            raise ValueError("в сумма:ОТ-ДО нижняя граница больше верхней")
+    sources = [s for s in options.get("source", "").lower().split(",") if s]
+
+    rule = Rule(text, exact, field, min_amount, max_amount, sources)
+    if not rule.pattern:
+        raise ValueError("в ключевом слове нет ни одного слова")
+    return rule
+
+
+def literal(text):
+    # старые подписки, которые не разбираются как правило, ищутся как подстрока
+    return Rule(text.strip().lower(), exact=True)
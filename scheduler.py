@@ -0,0 +1,193 @@
+# scheduler.py — адаптивное расписание опроса площадок
+#
+# У каждой площадки своё время следующего опроса. Интервал подбирается так,
+# чтобы за опрос приходило около SCHED_TARGET_NEW новых тендеров: активные
+# площадки опрашиваются чаще, тихие — реже (в пределах SCHED_MIN/MAX_INTERVAL),
+# а медленные хосты — не чаще, чем позволяет их задержка. Ошибки дают
+# экспоненциальный backoff; после SCHED_BREAKER_FAILURES ошибок подряд
+# площадка отключается (circuit breaker) на SCHED_BREAKER_COOLDOWN и затем
+# получает одну пробную попытку. Площадки без url не опрашиваются вовсе.
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime
+
+from config import SITES
+
+# --- Настройки ---
+SCHED_BASE_INTERVAL = int(os.getenv("POLL_INTERVAL_SECONDS", 300))  # пока ничего не знаем о площадке
+SCHED_MIN_INTERVAL = int(os.getenv("SCHED_MIN_INTERVAL", 60))
+SCHED_MAX_INTERVAL = int(os.getenv("SCHED_MAX_INTERVAL", 3600))
+SCHED_TARGET_NEW = float(os.getenv("SCHED_TARGET_NEW", 10))  # желаемое число новых тендеров за опрос
+SCHED_LATENCY_FACTOR = float(os.getenv("SCHED_LATENCY_FACTOR", 20))  # интервал не меньше задержки × factor
+SCHED_BREAKER_FAILURES = int(os.getenv("SCHED_BREAKER_FAILURES", 5))
+SCHED_BREAKER_COOLDOWN = int(os.getenv("SCHED_BREAKER_COOLDOWN", 6 * 3600))
+SMOOTHING = 0.3  # вес нового наблюдения в скользящих средних
+QUIET_GROWTH = 1.5  # во сколько раз растёт интервал, если новых тендеров нет
+
+_sites = {}  # name -> состояние площадки
+
+
+def _jitter(seconds):
+    # чтобы площадки не синхронизировались и не опрашивались одной пачкой
+    return seconds * random.uniform(0.9, 1.1)
+
+
+def _clamp(seconds):
+    return max(SCHED_MIN_INTERVAL, min(SCHED_MAX_INTERVAL, seconds))
+
+
+def _ewma(old, value):
+    return value if old is None else old + SMOOTHING * (value - old)
+
+
+# --- Состояние ---
+def init(sites=None):
+    now = time.monotonic()
+    _sites.clear()
+    for site in (sites if sites is not None else SITES):
+        _sites[site["name"]] = {
+            "site": site,
+            "state": "ok" if site.get("url") else "disabled",
+            "interval": SCHED_BASE_INTERVAL,
+            "next_run": now,
+            "failures": 0,
+            "rate": None,  # новых тендеров в секунду
+            "latency": None,
+            "last_ok": None,
+            "last_run": None,
+            "last_new": 0,
+            "last_error": None,
+            "runs": 0,
+        }
+
+
+def _states():
+    if not _sites:
+        init()
+    return _sites.values()
+
+
+def due(now=None, only=None):
+    # площадки, которые пора опрашивать; их next_run сразу сдвигается,
+    # чтобы упавший цикл не превратился в опрос без пауз.
+    # only — имена площадок, арендованных этим процессом (leases.py)
+    now = time.monotonic() if now is None else now
+    sites = []
+    for st in _states():
+        if st["state"] == "disabled" or st["next_run"] > now:
+            continue
+        if only is not None and st["site"]["name"] not in only:
+            continue
+        if st["state"] == "open":
+            st["state"] = "half-open"
+            logging.info(f"Circuit half-open, probing site: {st['site']['name']}")
+        st["next_run"] = now + st["interval"]
+        sites.append(st["site"])
+    return sites
+
+
+def force(names, now=None):
+    # ручной /parse: опросить площадки при ближайшем due(); открытый breaker не трогаем
+    now = time.monotonic() if now is None else now
+    for st in _states():
+        if st["site"]["name"] in names and st["state"] not in ("disabled", "open"):
+            st["next_run"] = min(st["next_run"], now)
+
+
+def enabled_names():
+    return [st["site"]["name"] for st in _states() if st["state"] != "disabled"]
+
+
+def record(results):
+    now = time.monotonic()
+    for res in results:
+        st = _sites.get(res["site"].get("name"))
+        if st is None or st["state"] == "disabled":
+            continue
+        st["runs"] += 1
+        st["last_run"] = datetime.utcnow().isoformat(timespec="seconds")
+        if res["error"]:
+            _failed(st, res["error"], now)
+        else:
+            _succeeded(st, res, now)
+
+
+def _failed(st, error, now):
+    st["failures"] += 1
+    st["last_error"] = error
+    name = st["site"]["name"]
+    if st["state"] == "half-open" or st["failures"] >= SCHED_BREAKER_FAILURES:
+        st["state"] = "open"
+        st["next_run"] = now + _jitter(SCHED_BREAKER_COOLDOWN)
+        logging.warning(f"Circuit open for site {name} after {st['failures']} failures: {error}")
+        return
+    st["state"] = "backoff"
+    st["next_run"] = now + _jitter(min(SCHED_MAX_INTERVAL, SCHED_MIN_INTERVAL * 2 ** st["failures"]))
+
+
+def _succeeded(st, res, now):
+    if st["state"] == "half-open":
+        logging.info(f"Circuit closed for site: {st['site']['name']}")
+    st["state"] = "ok"
+    st["failures"] = 0
+    st["last_error"] = None
+    new = len(res["tenders"])
+    st["last_new"] = new
+    st["latency"] = _ewma(st["latency"], res["elapsed"])
+    since = now - st["last_ok"] if st["last_ok"] is not None else st["interval"]
+    st["last_ok"] = now
+    st["rate"] = _ewma(st["rate"], new / max(since, 1.0))
+    if res.get("more"):
+        # упёрлись в лимит страниц — хвост дочитываем как можно скорее
+        interval = SCHED_MIN_INTERVAL
+    elif new:
+        interval = SCHED_TARGET_NEW / st["rate"]
+    else:
+        interval = st["interval"] * QUIET_GROWTH
+    st["interval"] = _clamp(max(interval, st["latency"] * SCHED_LATENCY_FACTOR))
+    st["next_run"] = now + _jitter(st["interval"])
+
+
+# --- Ожидание и отчёт ---
+def seconds_until_next(now=None, only=None):
+    now = time.monotonic() if now is None else now
+    pending = [st["next_run"] for st in _states()
+               if st["state"] != "disabled" and (only is None or st["site"]["name"] in only)]
+    return max(0.0, min(pending) - now) if pending else None
+
+
+async def wait(only=None, at_most=SCHED_MAX_INTERVAL, wakeup=None):
+    # спим до ближайшего опроса, но не дольше at_most; wakeup (asyncio.Event) будит раньше
+    delay = seconds_until_next(only=only)
+    delay = at_most if delay is None else min(delay, at_most)
+    if wakeup is None:
+        await asyncio.sleep(delay)
+        return
+    try:
+        await asyncio.wait_for(wakeup.wait(), delay)
+    except asyncio.TimeoutError:
+        pass
+
+
+def snapshot():
+    now = time.monotonic()
+    rows = []
+    for st in _states():
+        rows.append({
+            "name": st["site"]["name"],
+            "url": st["site"].get("url"),
+            "state": st["state"],
+            "interval": round(st["interval"], 1),
+            "next_run_in": None if st["state"] == "disabled" else round(max(0.0, st["next_run"] - now), 1),
+            "failures": st["failures"],
+            "new_per_hour": None if st["rate"] is None else round(st["rate"] * 3600, 2),
+            "latency": None if st["latency"] is None else round(st["latency"], 3),
+            "last_run": st["last_run"],
+            "last_new": st["last_new"],
+            "last_error": st["last_error"],
+            "runs": st["runs"],
+        })
+    return sorted(rows, key=lambda r: (r["next_run_in"] is None, r["next_run_in"] or 0))
@@ -0,0 +1,108 @@
+# startup.py — хронометраж холодного старта
+#
+# Бесплатный инстанс Render засыпает и поднимается по первому запросу, так
+# что важно, сколько проходит до открытого порта и первого ответа health
+# check. Здесь копятся длительности импортов (вместе с зависимостями) и
+# отметки этапов в секундах от запуска процесса. Отчёт отдаёт GET /startup,
+# а когда этап "ready" наступил — он же пишется в лог.
+#
+# Один aiogram импортируется ~3 с (сборка моделей pydantic), поэтому порт
+# открывается ещё до него маленьким сервером из стандартной библиотеки в
+# отдельном потоке; он отвечает на health check и /startup, пока aiohttp
+# не готов занять порт сам.
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _process_age():
+    # сколько процесс прожил до импорта этого модуля (интерпретатор, site-packages); только Linux
+    try:
+        with open("/proc/self/stat") as f:
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - started_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+STARTED = time.perf_counter() - _process_age()
+imports = {}  # модуль -> секунд на первый импорт
+stages = {"interpreter": round(time.perf_counter() - STARTED, 4)}  # этап -> секунд от запуска
+
+
+def elapsed():
+    return time.perf_counter() - STARTED
+
+
+@contextmanager
+def timed_import(name):
+    # учитывается только первый импорт: повторный берётся из sys.modules
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        imports.setdefault(name, round(time.perf_counter() - began, 4))
+
+
+def mark(stage):
+    if stage in stages:
+        return
+    stages[stage] = round(elapsed(), 4)
+    if stage == "ready":
+        logging.info(f"Startup: {report()}")
+
+
+def report():
+    return {"uptime": round(elapsed(), 3), "imports": dict(imports), "stages": dict(stages)}
+
+
+# --- Ранний сервер ---
+class _EarlyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/startup":
+            body, content_type = json.dumps(report()), "application/json"
+        else:
+            mark("first_health")
+            body, content_type = "TenderuBot is starting ⏳", "text/plain; charset=utf-8"
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _EarlyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+_early = None
+
+
+def listen_early(port):
+    global _early
+    try:
+        _early = _EarlyServer(("0.0.0.0", port), _EarlyHandler)
+    except OSError:
+        logging.warning(f"Early listener could not bind port {port}")
+        return
+    threading.Thread(target=_early.serve_forever, args=(0.05,), name="early-http", daemon=True).start()
+    mark("listening_early")
+
+
+def stop_early():
+    # порт освобождается за миллисекунды до того, как его займёт aiohttp
+    global _early
+    if _early is not None:
+        _early.shutdown()
+        _early.server_close()
+        _early = None
@@ -0,0 +1,352 @@
+# storage.py — общий слой доступа к SQLite
+#
+# Долгоживущие соединения в пуле (WAL, synchronous=NORMAL, кэш страниц, mmap,
+# кэш подготовленных выражений), единая схема БД и async-обёртки, чтобы
+# обработчики aiogram не блокировали цикл событий дисковым I/O.
+import os
+import queue
+import asyncio
+import logging
+import sqlite3
+import threading
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+DB_PATH = os.getenv("DB_PATH", "database.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 8))
+DB_CACHE_KIB = int(os.getenv("DB_CACHE_KIB", 16384))  # кэш страниц на соединение
+DB_MMAP_BYTES = int(os.getenv("DB_MMAP_BYTES", 256 * 1024 * 1024))
+
+_pool = queue.LifoQueue()
+_pool_lock = threading.Lock()
+_created = 0
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="sqlite")
+
+
+# --- Соединения ---
+def _connect():
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False, cached_statements=256)
+    # до WAL и до первой таблицы, иначе не применится; старые базы переводит maintenance.py
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_BYTES}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def _acquire():
+    global _created
+    try:
+        return _pool.get_nowait()
+    except queue.Empty:
+        pass
+    with _pool_lock:
+        if _created < DB_POOL_SIZE:
+            _created += 1
+            try:
+                return _connect()
+            except Exception:
+                _created -= 1
+                raise
+    return _pool.get()
+
+
+def _release(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    _pool.put(conn)
+
+
+@contextmanager
+def connection():
+    conn = _acquire()
+    try:
+        yield conn
+    finally:
+        _release(conn)
+
+
+@contextmanager
+def transaction():
+    # commit при успешном выходе, rollback при исключении
+    with connection() as conn:
+        with conn:
+            yield conn
+
+
+def close_all():
+    global _created
+    with _pool_lock:
+        while True:
+            try:
+                _pool.get_nowait().close()
+            except queue.Empty:
+                break
+        _created = 0
+
+
+# --- Async-обёртки ---
+async def run(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(fn, *args, **kwargs))
+
+
+# --- Схема ---
+def _fold(expr):
+    # ё -> е перед индексом FTS: unicode61 их не склеивает, а запросы (rules.normalize) уже без ё
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+FTS_TRIGGERS = ("tenders_fts_ai", "tenders_fts_ad", "tenders_fts_au")
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS tenders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        purchase_number TEXT UNIQUE,
+        name TEXT,
+        customer TEXT,
+        amount REAL,
+        publish_date TEXT,
+        source TEXT,
+        inserted_at TEXT,
+        duplicate_of INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS subscriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        keyword TEXT,
+        UNIQUE(user_id, keyword)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        tender_id INTEGER NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT,
+        updated_at TEXT,
+        due_at TEXT,
+        UNIQUE(user_id, tender_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, id)",
+    # режим доставки; пользователей без строки здесь уведомляем сразу (instant)
+    """
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id INTEGER PRIMARY KEY,
+        delivery_mode TEXT NOT NULL DEFAULT 'instant',
+        updated_at TEXT
+    )
+    """,
+    # по нему maintenance.py находит тендеры старше окна хранения
+    "CREATE INDEX IF NOT EXISTS idx_tenders_inserted_at ON tenders(inserted_at)",
+    # счётчики для статистики, которые ведут триггеры: tenders, archived, source:<имя>, subscribers
+    """
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tenders_stats_ai AFTER INSERT ON tenders BEGIN
+        INSERT INTO stats_counters(name, value) VALUES ('tenders', 1), ('source:' || COALESCE(new.source, ''), 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tenders_stats_ad AFTER DELETE ON tenders BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE name IN ('tenders', 'source:' || COALESCE(old.source, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS subscriptions_stats_ai AFTER INSERT ON subscriptions
+    WHEN (SELECT COUNT(*) FROM subscriptions WHERE user_id = new.user_id) = 1 BEGIN
+        INSERT INTO stats_counters(name, value) VALUES ('subscribers', 1)
+            ON CONFLICT(name) DO UPDATE SET value = value + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS subscriptions_stats_ad AFTER DELETE ON subscriptions
+    WHEN NOT EXISTS (SELECT 1 FROM subscriptions WHERE user_id = old.user_id) BEGIN
+        UPDATE stats_counters SET value = value - 1 WHERE name = 'subscribers';
+    END
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        source TEXT PRIMARY KEY,
+        last_id TEXT,
+        last_date TEXT,
+        cursor TEXT,
+        updated_at TEXT
+    )
+    """,
+    # распределение площадок между процессами-сборщиками (workers.py fetch)
+    """
+    CREATE TABLE IF NOT EXISTS site_leases (
+        site TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS fetch_workers (
+        owner TEXT PRIMARY KEY,
+        heartbeat_at REAL NOT NULL
+    )
+    """,
+    # ручной /parse: номер запроса растёт, каждый сборщик опрашивает свои площадки вне очереди
+    """
+    CREATE TABLE IF NOT EXISTS poll_requests (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        seq INTEGER NOT NULL,
+        requested_at REAL NOT NULL
+    )
+    """,
+    # до какого тендера дошло сопоставление с подписками
+    """
+    CREATE TABLE IF NOT EXISTS match_cursor (
+        name TEXT PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    )
+    """,
+    # журнал изменений подписок: по нему другие процессы догоняют свой индекс в памяти
+    """
+    CREATE TABLE IF NOT EXISTS subscription_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        user_id INTEGER,
+        keyword TEXT
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS subscriptions_log_ai AFTER INSERT ON subscriptions BEGIN
+        INSERT INTO subscription_log(op, user_id, keyword) VALUES ('add', new.user_id, new.keyword);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS subscriptions_log_ad AFTER DELETE ON subscriptions BEGIN
+        INSERT INTO subscription_log(op, user_id, keyword) VALUES ('remove', old.user_id, old.keyword);
+    END
+    """,
+    # LSH-полосы MinHash-подписей недавних тендеров (neardup.py)
+    # ключи тендеров, унесённых в архив: архив не под UNIQUE(purchase_number),
+    # и без этой таблицы тендер без даты пришёл бы заново после перезапуска
+    """
+    CREATE TABLE IF NOT EXISTS archived_keys (
+        purchase_number TEXT PRIMARY KEY,
+        source TEXT
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS tender_lsh (
+        bucket INTEGER NOT NULL,
+        tender_id INTEGER NOT NULL,
+        PRIMARY KEY (bucket, tender_id)
+    ) WITHOUT ROWID
+    """,
+    # полнотекстовый индекс по названию и заказчику; unicode61 сам приводит регистр
+    # кириллицы и считает казахские буквы (ә, ғ, қ, ң, ө, ұ, ү, һ, і) частью слова.
+    # В индекс попадает текст с ё -> е, в самой tenders он хранится как есть
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS tenders_fts USING fts5(
+        name, customer,
+        content='tenders', content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2",
+        prefix='2 3 4'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tenders_fts_ai AFTER INSERT ON tenders BEGIN
+        INSERT INTO tenders_fts(rowid, name, customer) VALUES (new.id, {_fold("new.name")}, {_fold("new.customer")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tenders_fts_ad AFTER DELETE ON tenders BEGIN
+        INSERT INTO tenders_fts(tenders_fts, rowid, name, customer)
+        VALUES ('delete', old.id, {_fold("old.name")}, {_fold("old.customer")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS tenders_fts_au AFTER UPDATE OF name, customer ON tenders BEGIN
+        INSERT INTO tenders_fts(tenders_fts, rowid, name, customer)
+        VALUES ('delete', old.id, {_fold("old.name")}, {_fold("old.customer")});
+        INSERT INTO tenders_fts(rowid, name, customer) VALUES (new.id, {_fold("new.name")}, {_fold("new.customer")});
+    END
+    """,
+]
+
+# колонки, которых нет в базах, созданных старыми версиями
+MIGRATIONS = [
+    ("tenders", "source", "ALTER TABLE tenders ADD COLUMN source TEXT"),
+    ("tenders", "duplicate_of", "ALTER TABLE tenders ADD COLUMN duplicate_of INTEGER"),
+    ("outbox", "due_at", "ALTER TABLE outbox ADD COLUMN due_at TEXT"),
+]
+
+# после MIGRATIONS: опираются на добавленные ими колонки
+LATE_SCHEMA = [
+    # отправитель забирает только строки, чей срок (due_at) наступил — дайджесты ждут своего часа
+    "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, due_at)",
+    # строки из версий без due_at отправляются как раньше, сразу
+    "UPDATE outbox SET due_at = COALESCE(created_at, '') WHERE status = 'pending' AND due_at IS NULL",
+]
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def create_tables():
+    with transaction() as conn:
+        has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name='tenders_fts'").fetchone()
+        has_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name='stats_counters'").fetchone()
+        has_keys = conn.execute("SELECT 1 FROM sqlite_master WHERE name='archived_keys'").fetchone()
+        trigger = conn.execute("SELECT sql FROM sqlite_master WHERE name='tenders_fts_ai'").fetchone()
+        refold = trigger is not None and "'ё'" not in trigger[0]
+        if refold:
+            # триггеры из версий, где индекс хранил ё как есть
+            for name in FTS_TRIGGERS:
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for ddl in SCHEMA:
+            conn.execute(ddl)
+        for table, column, ddl in MIGRATIONS:
+            if column not in _columns(conn, table):
+                conn.execute(ddl)
+        for ddl in LATE_SCHEMA:
+            conn.execute(ddl)
+        if not has_fts or refold:
+            # индекс появился впервые или без ё -> е — проиндексировать накопленные тендеры заново;
+            # 'rebuild' взял бы текст из tenders как есть
+            conn.execute("INSERT INTO tenders_fts(tenders_fts) VALUES ('delete-all')")
+            conn.execute(
+                f"INSERT INTO tenders_fts(rowid, name, customer) "
+                f"SELECT id, {_fold('name')}, {_fold('customer')} FROM tenders"
+            )
+        if not has_stats:
+            # счётчики появились впервые — один раз считаем всё полным проходом
+            conn.execute("INSERT INTO stats_counters (name, value) SELECT 'tenders', COUNT(*) FROM tenders")
+            conn.execute(
+                "INSERT INTO stats_counters (name, value) "
+                "SELECT 'source:' || COALESCE(source, ''), COUNT(*) FROM tenders GROUP BY 1"
+            )
+            conn.execute("INSERT INTO stats_counters (name, value) SELECT 'subscribers', COUNT(DISTINCT user_id) FROM subscriptions")
+        if not has_keys:
+            # архив мог накопиться до таблицы ключей — собрать их из помесячных таблиц
+            archives = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'tenders_archive_%'"
+            )]
+            for table in archives:
+                conn.execute(
+                    f"INSERT OR IGNORE INTO archived_keys (purchase_number, source) "
+                    f"SELECT purchase_number, source FROM {table} WHERE purchase_number IS NOT NULL"
+                )
+        # курсор сопоставления стартует с конца таблицы: старые тендеры уже разосланы
+        conn.execute("INSERT OR IGNORE INTO match_cursor (name, last_id) SELECT 'match', COALESCE(MAX(id), 0) FROM tenders")
+    logging.info("DB tables ensured.")
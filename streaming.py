@@ -0,0 +1,107 @@
+# streaming.py — потоковый разбор JSON/XML/RSS прямо по мере чтения ответа
+#
+# Вместо r.json() / r.text тело читается кусками: JSON-массив разбирается
+# поэлементно через raw_decode, XML — XMLPullParser с очисткой разобранных
+# элементов. Потребитель может прервать чтение в любой момент (набран limit
+# или встретился уже виденный тендер) — остаток ответа не скачивается.
+import os
+import json
+import codecs
+
+from lxml import etree
+
+import parsing
+
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", 64 * 1024))
+STREAM_TYPES = ("json", "xml", "rss")
+
+_decoder = json.JSONDecoder()
+_WS = " \t\r\n"
+
+
+async def iter_json_items(chunks, encoding="utf-8", meta=None):
+    # элементы JSON-массива верхнего уровня; для объекта-страницы
+    # ({"items": [...], "next_page": ...}) ссылка на следующую кладётся в meta
+    text = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    buf = ""
+    pos = 0
+    started = False
+    done = False
+    async for chunk in chunks:
+        buf += text.decode(chunk)
+        if not started:
+            stripped = buf.lstrip(_WS + "\ufeff")
+            if not stripped:
+                continue
+            if stripped[0] != "[":
+                # не массив: дочитываем и разбираем как обычно
+                rest = [buf]
+                async for more in chunks:
+                    rest.append(text.decode(more))
+                rest.append(text.decode(b"", final=True))
+                items, next_page = parsing.json_page(json.loads("".join(rest).lstrip("\ufeff")))
+                if meta is not None:
+                    meta["next_page"] = next_page
+                for item in items:
+                    yield item
+                return
+            buf = stripped
+            pos = 1
+            started = True
+        while True:
+            while pos < len(buf) and buf[pos] in _WS + ",":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                done = True
+                break
+            try:
+                item, end = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # элемент пришёл не целиком — ждём следующий кусок
+            if buf[pos] not in '{["' and (end == len(buf) or buf[end] not in _WS + ",]"):
+                break  # число/литерал на краю куска может быть обрезано
+            pos = end
+            yield item
+        if done:
+            return
+        # разобранную часть буфера выбрасываем, чтобы память не росла с размером ленты
+        buf = buf[pos:]
+        pos = 0
+    if started and buf.strip(_WS):
+        raise ValueError("Truncated JSON array in response")
+
+
+async def iter_xml_elements(chunks, tag):
+    parser = etree.XMLPullParser(events=("end",), tag=tag, recover=True, huge_tree=True)
+    async for chunk in chunks:
+        parser.feed(chunk)
+        for _, el in parser.read_events():
+            yield el
+            # освобождаем элемент и уже обработанных соседей
+            el.clear(keep_tail=True)
+            parent = el.getparent()
+            if parent is not None:
+                while el.getprevious() is not None:
+                    del parent[0]
+    parser.close()
+
+
+async def iter_rows(site, response, meta=None, chunks=None):
+    # кортежи в формате parsing.FIELDS по мере поступления данных;
+    # chunks — уже прочитанное тело кусками, если его пришлось дочитать заранее
+    source = site.get("name") or ""
+    site_type = site.get("type")
+    if chunks is None:
+        chunks = response.content.iter_chunked(STREAM_CHUNK_BYTES)
+    if site_type == "json":
+        async for item in iter_json_items(chunks, response.charset, meta):
+            if isinstance(item, dict):
+                yield parsing.json_row(item, source)
+    elif site_type == "xml":
+        async for el in iter_xml_elements(chunks, "{*}tender"):
+            yield parsing.xml_row(el, source)
+    elif site_type == "rss":
+        async for el in iter_xml_elements(chunks, "{*}item"):
+            yield parsing.rss_row(el, source)
@@ -0,0 +1,170 @@
+# subscriptions.py — индекс подписок в памяти процесса
+#
+# Загружается из БД один раз (tender_parser.load_subscriptions) и дальше
+# обновляется сквозной записью из add_subscription / remove_subscription,
+# а изменения из других процессов догоняются по subscription_log (db.sync_subscriptions).
+#
+# Подписка — строка-правило (rules.py). Тексты всех правил лежат в двух
+# автоматах Ахо–Корасик: как есть и с опцией «формы» — по нормализованному тексту.
+# Тендер проходит каждый автомат один раз по названию (и по заказчику,
+# если такие правила есть), а фильтры по сумме и площадке проверяются
+# только у правил, чей текст нашёлся, — по одному разу на правило, а не
+# на каждого подписчика.
+import logging
+import threading
+
+import rules
+from matcher import KeywordMatcher
+
+_lock = threading.RLock()
+_by_rule = {}  # keyword (строка правила) -> {user_id}
+_by_user = {}  # user_id -> {keyword}
+_rules = {}  # keyword -> rules.Rule
+_by_pattern = {}  # (exact, needle) -> {keyword}
+_matchers = {False: KeywordMatcher(), True: KeywordMatcher()}  # exact -> автомат
+_scoped = {"name": 0, "customer": 0, "any": 0}  # сколько правил смотрит в каждое поле
+_loaded = False
+_log_seq = 0  # последняя применённая запись subscription_log
+
+
+def is_loaded():
+    return _loaded
+
+
+def _compile(keyword):
+    try:
+        return rules.parse(keyword)
+    except ValueError:
+        logging.warning(f"Subscription is not a valid rule, matching it literally: {keyword!r}")
+        return rules.literal(keyword)
+
+
+def _index(keyword):
+    rule = _compile(keyword)
+    _rules[keyword] = rule
+    key = (rule.exact, rule.needle)
+    keywords = _by_pattern.setdefault(key, set())
+    if not keywords:
+        _matchers[rule.exact].add(rule.needle)
+    keywords.add(keyword)
+    _scoped[rule.field] += 1
+
+
+def _unindex(keyword):
+    rule = _rules.pop(keyword)
+    key = (rule.exact, rule.needle)
+    keywords = _by_pattern[key]
+    keywords.discard(keyword)
+    if not keywords:
+        del _by_pattern[key]
+        _matchers[rule.exact].remove(rule.needle)
+    _scoped[rule.field] -= 1
+
+
+def load(rows, log_seq=0):
+    global _loaded, _log_seq, _matchers
+    with _lock:
+        _by_rule.clear()
+        _by_user.clear()
+        _rules.clear()
+        _by_pattern.clear()
+        _matchers = {False: KeywordMatcher(), True: KeywordMatcher()}
+        for field in _scoped:
+            _scoped[field] = 0
+        for user_id, keyword in rows:
+            users = _by_rule.setdefault(keyword, set())
+            if not users:
+                _index(keyword)
+            users.add(user_id)
+            _by_user.setdefault(user_id, set()).add(keyword)
+        _loaded = True
+        _log_seq = log_seq
+
+
+def log_seq():
+    return _log_seq
+
+
+def apply_log(entries):
+    # записи журнала идемпотентны: свои же изменения применяются повторно без вреда
+    global _log_seq
+    with _lock:
+        for seq, op, user_id, keyword in entries:
+            if op == "add":
+                add(user_id, keyword)
+            elif op == "remove":
+                remove(user_id, keyword)
+            _log_seq = max(_log_seq, seq)
+
+
+def add(user_id: int, keyword: str):
+    with _lock:
+        users = _by_rule.setdefault(keyword, set())
+        if not users:
+            _index(keyword)
+        users.add(user_id)
+        _by_user.setdefault(user_id, set()).add(keyword)
+
+
+def remove(user_id: int, keyword: str):
+    with _lock:
+        users = _by_rule.get(keyword)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del _by_rule[keyword]
+                _unindex(keyword)
+        keywords = _by_user.get(user_id)
+        if keywords is not None:
+            keywords.discard(keyword)
+            if not keywords:
+                del _by_user[user_id]
+
+
+def users_for(keyword):
+    # копия: индекс могут менять обработчики из потоков БД
+    with _lock:
+        return tuple(_by_rule.get(keyword, ()))
+
+
+def keywords_for(user_id: int):
+    with _lock:
+        return tuple(_by_user.get(user_id, ()))
+
+
+def snapshot():
+    with _lock:
+        return {kw: set(users) for kw, users in _by_rule.items()}
+
+
+def subscriber_count():
+    return len(_by_user)
+
+
+# --- Сопоставление ---
+def _hits(exact, matcher, t, found):
+    texts = {}
+    if _scoped["name"] or _scoped["any"]:
+        texts["name"] = t.name_lower
+    if (_scoped["customer"] or _scoped["any"]) and t.customer:
+        texts["customer"] = t.customer.lower()
+    for field, text in texts.items():
+        for needle in matcher.find(text if exact else rules.words(text)):
+            for keyword in _by_pattern[(exact, needle)]:
+                rule_field = _rules[keyword].field
+                if rule_field == field or rule_field == "any":
+                    found.add(keyword)
+
+
+def match_tender(t):
+    # все подписчики, чьи правила подходят к тендеру models.Tender
+    users = set()
+    with _lock:
+        found = set()
+        for exact, matcher in _matchers.items():
+            if len(matcher):
+                _hits(exact, matcher, t, found)
+        for keyword in found:
+            if _rules[keyword].accepts(t):
+                users.update(_by_rule[keyword])
+    return users
@@ -0,0 +1,99 @@
+# sync_state.py — отметки синхронизации (high-water marks) по каждой площадке
+#
+# Для каждой площадки храним самый свежий тендер, который точно сохранён
+# (last_id / last_date; в памяти дата — datetime), и курсоры страниц, с которых нужно продолжить
+# разбор хвостов, если упёрлись в лимит страниц. Хвостов может быть несколько:
+# пока дочитывается старый, новый опрос от головы тоже может упереться в лимит.
+# В БД они лежат в колонке cursor через перевод строки (в URL его не бывает).
+# Новые отметки сначала «ставятся» (stage) при загрузке и записываются
+# в БД (commit) только после того, как тендеры сохранены; вместе с ними
+# сохраняются и ETag/хэши страниц (http_cache).
+import logging
+import threading
+from datetime import datetime
+
+import http_cache
+import storage
+from models import format_date, parse_date
+
+_lock = threading.Lock()
+_marks = {}  # source -> {"last_id", "last_date", "cursors": [url, ...] от новых к старым}
+_staged = {}
+
+
+def _empty():
+    return {"last_id": None, "last_date": None, "cursors": []}
+
+
+def load():
+    with storage.connection() as conn:
+        rows = conn.execute("SELECT source, last_id, last_date, cursor FROM sync_state").fetchall()
+    with _lock:
+        _marks.clear()
+        for source, last_id, last_date, cursor in rows:
+            cursors = cursor.split("\n") if cursor else []
+            _marks[source] = {"last_id": last_id, "last_date": parse_date(last_date), "cursors": cursors}
+    logging.info(f"Loaded sync state for {len(rows)} sources.")
+
+
+def get(source):
+    with _lock:
+        mark = dict(_marks.get(source) or _empty())
+    mark["cursors"] = list(mark["cursors"])
+    return mark
+
+
+def crossed(mark, purchase_number, published):
+    # дошли ли до уже синхронизированной части ленты; published — datetime,
+    # исходный текст нераспознанной даты или None (по дате тогда не сравниваем)
+    if mark.get("last_id") is not None and str(purchase_number) == mark["last_id"]:
+        return True
+    last_date = mark.get("last_date")
+    if last_date is not None and isinstance(published, datetime):
+        return published < last_date
+    return False
+
+
+def stage(source, top, cursors):
+    # top — самый свежий кортеж этого прохода (или None, если ничего нового);
+    # cursors — все недочитанные хвосты после прохода
+    with _lock:
+        mark = dict(_marks.get(source) or _empty())
+        if top is not None:
+            mark["last_id"] = str(top[0])
+            mark["last_date"] = top[4] if isinstance(top[4], datetime) else None
+        mark["cursors"] = list(cursors)
+        _staged[source] = mark
+
+
+def commit():
+    with _lock:
+        staged = dict(_staged)
+        _staged.clear()
+    http_cache.commit()
+    if not staged:
+        return 0
+    now = datetime.utcnow().isoformat()
+    with storage.transaction() as conn:
+        conn.executemany("""
+            INSERT INTO sync_state (source, last_id, last_date, cursor, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(source) DO UPDATE SET
+                last_id=excluded.last_id, last_date=excluded.last_date,
+                cursor=excluded.cursor, updated_at=excluded.updated_at
+        """, [(s, m["last_id"], format_date(m["last_date"]) or None, "\n".join(m["cursors"]) or None, now)
+              for s, m in staged.items()])
+    with _lock:
+        _marks.update(staged)
+    return len(staged)
+
+
+def discard():
+    with _lock:
+        _staged.clear()
+    http_cache.discard()
+
+
+def snapshot():
+    with _lock:
+        return {source: dict(mark) for source, mark in _marks.items()}
@@ -1,10 +1,16 @@
 # tender_parser.py
+import json
 import requests
-import sqlite3
 import logging
-from datetime import datetime
 from bs4 import BeautifulSoup
-from db import DB_PATH
+import dedup
+import metrics
+from models import Tender
+# работа с БД живёт в db.py / storage.py; имена оставлены здесь для совместимости
+from db import (
+    DB_PATH, create_tables, save_new_tenders, load_subscriptions, load_seen_tenders,
+    get_subscriptions, add_subscription, remove_subscription, list_user_keywords
+)
 from config import SITES as PLATFORMS  # импортируем площадки
 
 logging.basicConfig(
@@ -13,85 +19,6 @@ logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
 
-# ----------------- База данных -----------------
-def get_conn():
-    return sqlite3.connect(DB_PATH, timeout=30)
-
-def create_tables():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS tenders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            purchase_number TEXT UNIQUE,
-            name TEXT,
-            customer TEXT,
-            amount REAL,
-            publish_date TEXT,
-            source TEXT,
-            inserted_at TEXT
-        )
-    """)
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS subscriptions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            keyword TEXT,
-            UNIQUE(user_id, keyword)
-        )
-    """)
-    conn.commit()
-    conn.close()
-    logging.info("DB tables ensured.")
-
-# ----------------- Подписки -----------------
-def get_subscriptions():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT user_id, keyword FROM subscriptions")
-    rows = cur.fetchall()
-    conn.close()
-    subs = {}
-    for user_id, keyword in rows:
-        subs.setdefault(keyword.lower(), set()).add(user_id)
-    return subs
-
-def add_subscription(user_id: int, keyword: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "INSERT OR IGNORE INTO subscriptions (user_id, keyword) VALUES (?, ?)",
-            (user_id, keyword.strip().lower())
-        )
-        conn.commit()
-    except Exception:
-        logging.exception("Failed to add subscription")
-    finally:
-        conn.close()
-
-def remove_subscription(user_id: int, keyword: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute(
-            "DELETE FROM subscriptions WHERE user_id=? AND keyword=?",
-            (user_id, keyword.strip().lower())
-        )
-        conn.commit()
-    except Exception:
-        logging.exception("Failed to remove subscription")
-    finally:
-        conn.close()
-
-def list_user_keywords(user_id: int):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT keyword FROM subscriptions WHERE user_id=?", (user_id,))
-    rows = [r[0] for r in cur.fetchall()]
-    conn.close()
-    return rows
-
 # ----------------- Парсеры -----------------
 def fetch_json(url, params=None):
     try:
@@ -99,6 +26,7 @@ def fetch_json(url, params=None):
         r.raise_for_status()
         return r.json()
     except Exception:
+        metrics.ERRORS.labels("fetch").inc()
         logging.exception(f"Failed to fetch JSON from {url}")
         return []
 
@@ -108,106 +36,103 @@ def fetch_html(url):
         r.raise_for_status()
         return r.text
     except Exception:
+        metrics.ERRORS.labels("fetch").inc()
         logging.exception(f"Failed to fetch HTML from {url}")
         return ""
 
 def save_tender(purchase_number, name, customer, amount, publish_date, source):
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-            INSERT INTO tenders (purchase_number, name, customer, amount, publish_date, source, inserted_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (str(purchase_number), name, customer, amount, publish_date, source, datetime.utcnow().isoformat()))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        pass
-    except Exception:
-        logging.exception("Error inserting tender")
-    finally:
-        conn.close()
+    return save_new_tenders([Tender(purchase_number, name, customer, amount, publish_date, source)])
+
+# ----------------- Разбор страниц -----------------
+def parse_json(data, limit=50, source="", seen=None):
+    tenders = []
+    if not isinstance(data, list):
+        return tenders
+    for item in data[:limit]:
+        purchase_number = item.get("id") or item.get("purchase_number")
+        if seen is not None and seen(source, purchase_number):
+            continue
+        t_name = item.get("title") or item.get("name")
+        customer = item.get("ref_customer_name_ru") or item.get("customer")
+        amount = item.get("amount") or 0
+        publish_date = item.get("date") or item.get("publish_date")
+        tenders.append(Tender(purchase_number, t_name, customer, amount, publish_date, source))
+    return tenders
+
+def parse_html(html, selector, limit=50, source="", seen=None):
+    tenders = []
+    soup = BeautifulSoup(html, "html.parser")
+    items = soup.select(selector or "")
+    for el in items[:limit]:
+        t_name = el.get_text(strip=True)
+        purchase_number = el.get("href") or t_name
+        if seen is not None and seen(source, purchase_number):
+            continue
+        tenders.append(Tender(purchase_number, t_name, source=source))
+    return tenders
+
+def parse_xml(html, limit=50, source="", seen=None):
+    tenders = []
+    soup = BeautifulSoup(html, "xml")
+    for item in soup.find_all("tender")[:limit]:
+        purchase_number = item.find("id").text if item.find("id") else ""
+        if seen is not None and seen(source, purchase_number):
+            continue
+        t_name = item.find("title").text if item.find("title") else ""
+        customer = item.find("customer").text if item.find("customer") else ""
+        amount = item.find("amount").text if item.find("amount") else 0
+        publish_date = item.find("date").text if item.find("date") else None
+        tenders.append(Tender(purchase_number, t_name, customer, amount, publish_date, source))
+    return tenders
+
+def parse_rss(html, limit=50, source="", seen=None):
+    tenders = []
+    soup = BeautifulSoup(html, "xml")
+    for item in soup.find_all("item")[:limit]:
+        t_name = item.find("title").text if item.find("title") else ""
+        purchase_number = item.find("link").text if item.find("link") else t_name
+        if seen is not None and seen(source, purchase_number):
+            continue
+        publish_date = item.find("pubDate").text if item.find("pubDate") else None
+        tenders.append(Tender(purchase_number, t_name, published=publish_date, source=source))
+    return tenders
+
+def parse_site(site, body, limit=50, seen=None):
+    # body — сырой текст ответа; для json он декодируется здесь
+    site_type = site.get("type")
+    source = site.get("name") or ""
+    if not body:
+        return []
+    if site_type == "json":
+        return parse_json(json.loads(body), limit, source, seen)
+    if site_type == "html":
+        return parse_html(body, site.get("selector"), limit, source, seen)
+    if site_type == "xml":
+        return parse_xml(body, limit, source, seen)
+    if site_type == "rss":
+        return parse_rss(body, limit, source, seen)
+    return []
 
 # ----------------- Основной fetch -----------------
-def fetch_tenders(limit=50):
+def fetch_tenders(limit=50, sites=None):
     all_tenders = []
 
-    for site in PLATFORMS:
+    for site in (sites if sites is not None else PLATFORMS):
         name = site.get("name")
         site_type = site.get("type")
         url = site.get("url")
-        selector = site.get("selector")
 
         if not url:
             continue
 
         try:
-            if site_type == "json":
-                data = fetch_json(url)
-                if isinstance(data, list):
-                    for item in data[:limit]:
-                        purchase_number = item.get("id") or item.get("purchase_number")
-                        t_name = item.get("title") or item.get("name")
-                        customer = item.get("ref_customer_name_ru") or item.get("customer")
-                        amount = item.get("amount") or 0
-                        publish_date = item.get("date") or item.get("publish_date") or ""
-                        all_tenders.append({
-                            "purchase_number": purchase_number,
-                            "name": t_name,
-                            "customer": customer,
-                            "amount": amount,
-                            "publish_date": publish_date
-                        })
-            elif site_type == "html":
-                html = fetch_html(url)
-                if not html:
-                    continue
-                soup = BeautifulSoup(html, "html.parser")
-                items = soup.select(selector or "")
-                for el in items[:limit]:
-                    t_name = el.get_text(strip=True)
-                    purchase_number = el.get("href") or t_name
-                    all_tenders.append({
-                        "purchase_number": purchase_number,
-                        "name": t_name,
-                        "customer": "",
-                        "amount": 0,
-                        "publish_date": ""
-                    })
-            elif site_type == "xml":
-                html = fetch_html(url)
-                if not html:
-                    continue
-                soup = BeautifulSoup(html, "xml")
-                for item in soup.find_all("tender")[:limit]:
-                    purchase_number = item.find("id").text if item.find("id") else ""
-                    t_name = item.find("title").text if item.find("title") else ""
-                    customer = item.find("customer").text if item.find("customer") else ""
-                    amount = float(item.find("amount").text) if item.find("amount") else 0
-                    publish_date = item.find("date").text if item.find("date") else ""
-                    all_tenders.append({
-                        "purchase_number": purchase_number,
-                        "name": t_name,
-                        "customer": customer,
-                        "amount": amount,
-                        "publish_date": publish_date
-                    })
-            elif site_type == "rss":
-                html = fetch_html(url)
-                if not html:
-                    continue
-                soup = BeautifulSoup(html, "xml")
-                for item in soup.find_all("item")[:limit]:
-                    t_name = item.find("title").text if item.find("title") else ""
-                    purchase_number = item.find("link").text if item.find("link") else t_name
-                    publish_date = item.find("pubDate").text if item.find("pubDate") else ""
-                    all_tenders.append({
-                        "purchase_number": purchase_number,
-                        "name": t_name,
-                        "customer": "",
-                        "amount": 0,
-                        "publish_date": publish_date
-                    })
+            with metrics.FETCH_SECONDS.labels(name).time():
+                if site_type == "json":
+                    all_tenders.extend(parse_json(fetch_json(url), limit, name, dedup.seen))
+                else:
+                    all_tenders.extend(parse_site(site, fetch_html(url), limit, dedup.seen))
         except Exception:
+            metrics.ERRORS.labels("parse").inc()
             logging.exception(f"Error parsing site: {name}")
 
     logging.info(f"Fetched {len(all_tenders)} tenders from platforms.")
@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+import pytest
+
+# база — во временном каталоге, а не database.db
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "database.db"))
+
+import db  # noqa: E402
+import dedup  # noqa: E402
+import storage  # noqa: E402
+from models import Tender  # noqa: E402
+
+
+@pytest.fixture(scope="module", autouse=True)
+def tenders():
+    storage.create_tables()
+    with storage.transaction() as conn:
+        conn.execute("DELETE FROM tenders")
+    dedup.reset()
+    db.save_new_tenders([
+        Tender("1", "Поставка железобетонных изделий", "ТОО Стройка", source="a"),
+        Tender("2", "Бетон М300", source="a"),
+        Tender("3", "Ремонт стальных труб", "Акимат", source="b"),
+        Tender("4", "Поставка трубы", source="b"),
+        Tender("5", "Услуги связи", "АО Бетонный завод", source="b"),
+    ])
+
+
+def numbers(keyword, **kwargs):
+    return sorted(t.purchase_number for t in db.find_recent_matches(keyword, 7, **kwargs))
+
+
+def test_exact_rule_matches_inside_words():
+    # FTS ищет с начала слова и «железобетонных» бы не нашёл
+    assert numbers("бетон") == ["1", "2"]
+    assert numbers("зобетон") == ["1"]
+
+
+def test_exact_rule_respects_field():
+    assert numbers("бетон где:заказчик") == ["5"]
+    assert numbers("бетон где:везде") == ["1", "2", "5"]
+
+
+def test_stem_rule_matches_word_forms():
+    assert numbers("трубы формы") == ["3", "4"]
+    assert numbers("етон формы") == []
+
+
+def test_limit_keeps_newest():
+    assert numbers("бетон где:везде", limit=2) == ["2", "5"]
+
+
+def test_search_is_word_prefix():
+    assert sorted(t.purchase_number for t in db.search_tenders("бетон")) == ["2", "5"]
@@ -0,0 +1,145 @@
+import asyncio
+
+import pytest
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+import delivery
+from delivery import DeliveryQueue, TokenBucket, pack_groups, pack_messages
+
+
+class FakeBot:
+    # errors — chat_id -> список исключений, которые по очереди бросит send_message
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        pending = self.errors.get(chat_id)
+        if pending:
+            raise pending.pop(0)
+        self.sent.append((chat_id, text))
+
+
+def flood(chat_id, retry_after=0):
+    return TelegramRetryAfter(SendMessage(chat_id=chat_id, text=""), "Flood control exceeded", retry_after)
+
+
+def deliver(bot, batches, **kwargs):
+    # batches — [(chat_id, texts, keys)]; -> (очередь после join, вызовы on_done)
+    done = []
+
+    async def run():
+        queue = DeliveryQueue(bot, workers=2, global_rate=1000, chat_rate=1000, **kwargs)
+        await queue.start()
+        for chat_id, texts, keys in batches:
+            queue.enqueue(chat_id, texts, on_done=lambda keys, ok: done.append((keys, ok)), keys=keys)
+        await asyncio.wait_for(queue.join(), 5)
+        await queue.stop()
+        return queue
+
+    return asyncio.run(run()), done
+
+
+# --- Склейка ---
+def test_pack_groups_fills_messages_up_to_limit():
+    texts = ["a" * 4, "b" * 4, "c" * 4, "d" * 9]
+    assert pack_groups(texts, limit=10, sep="|") == [
+        ("aaaa|bbbb", [0, 1]),
+        ("cccc", [2]),
+        ("d" * 9, [3]),
+    ]
+
+
+def test_pack_messages_truncates_long_text():
+    messages = pack_messages(["x" * 25, "y"], limit=10)
+    assert messages == ["x" * 10, "y"]
+    assert all(len(m) <= 10 for m in messages)
+
+
+def test_pack_messages_default_limit():
+    texts = ["t" * 1000] * 9
+    messages = pack_messages(texts)
+    assert len(messages) == 3
+    assert all(len(m) <= delivery.MAX_MESSAGE_LENGTH for m in messages)
+    assert sum(m.count("t") for m in messages) == 9000
+
+
+# --- Токен-бакет ---
+def test_bucket_reserves_slots_in_advance():
+    bucket = TokenBucket(rate=2, capacity=1)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.05)
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+    assert not bucket.is_idle()
+
+
+def test_bucket_pause_blocks_tokens():
+    bucket = TokenBucket(rate=100)
+    bucket.pause(3)
+    assert bucket.reserve() == pytest.approx(3, abs=0.05)
+    assert not bucket.is_idle()
+
+
+def test_bucket_acquire_waits_for_refill():
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=1)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _ in range(3):
+            await bucket.acquire()
+        return loop.time() - started
+
+    assert asyncio.run(run()) == pytest.approx(0.1, abs=0.05)
+
+
+# --- Очередь ---
+def test_queue_delivers_packed_messages_in_order():
+    bot = FakeBot()
+    texts = ["x" * 3000, "y" * 3000, "z" * 10]
+    queue, done = deliver(bot, [(1, texts, ["a", "b", "c"]), (2, ["hi"], ["d"])])
+    assert [text[0] for chat_id, text in bot.sent if chat_id == 1] == ["x", "y"]
+    assert sorted(done) == [(["a"], True), (["b", "c"], True), (["d"], True)]
+    assert queue.stats == {"sent": 3, "failed": 0, "retried": 0, "flood_waits": 0}
+
+
+def test_flood_wait_is_retried():
+    bot = FakeBot({1: [flood(1)]})
+    queue, done = deliver(bot, [(1, ["hello"], [7])])
+    assert bot.sent == [(1, "hello")]
+    assert done == [([7], True)]
+    assert queue.stats["flood_waits"] == 1
+    assert queue.stats["retried"] == 1
+    assert queue.stats["sent"] == 1
+
+
+def test_flood_wait_pauses_global_bucket():
+    async def run():
+        queue = DeliveryQueue(FakeBot({1: [flood(1, retry_after=30)]}), workers=1)
+        await queue._send((1, "hello", 0, None, False))
+        delay = queue.global_bucket.reserve()
+        await queue.stop()
+        return delay
+
+    assert asyncio.run(run()) == pytest.approx(30, abs=0.5)
+
+
+def test_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(delivery, "MAX_ATTEMPTS", 3)
+    bot = FakeBot({1: [flood(1) for _ in range(5)]})
+    queue, done = deliver(bot, [(1, ["hello"], [7]), (2, ["other"], [8])])
+    assert bot.sent == [(2, "other")]
+    assert sorted(done) == [([7], False), ([8], True)]
+    assert queue.stats["flood_waits"] == 3
+    assert queue.stats["retried"] == 2
+    assert queue.stats["failed"] == 1
+
+
+def test_blocked_chat_is_not_retried():
+    blocked = TelegramForbiddenError(SendMessage(chat_id=1, text=""), "bot was blocked by the user")
+    bot = FakeBot({1: [blocked]})
+    queue, done = deliver(bot, [(1, ["hello"], [7])])
+    assert bot.sent == []
+    assert done == [([7], False)]
+    assert queue.stats["retried"] == 0
+    assert queue.stats["failed"] == 1
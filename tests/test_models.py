@@ -0,0 +1,60 @@
+import pytest
+from datetime import datetime
+
+from models import Tender, parse_amount, read_date
+
+
+@pytest.mark.parametrize("value, expected", [
+    (1500000, 1500000.0),
+    (12.5, 12.5),
+    ("", 0.0),
+    (None, 0.0),
+    ("1500000", 1500000.0),
+    ("1500000.50", 1500000.5),
+    ("1 500 000,00", 1500000.0),
+    ("1\xa0500\xa0000,50", 1500000.5),
+    ("1,500,000", 1500000.0),
+    ("1,500,000.00", 1500000.0),
+    ("1.500.000,00", 1500000.0),
+    ("1.500.000", 1500000.0),
+    ("1,500", 1500.0),
+    ("1,5", 1.5),
+    ("12.5", 12.5),
+    ("12 тг", 12.0),
+    ("1 500 000 тенге", 1500000.0),
+    ("1 500 000,00 ₸", 1500000.0),
+    ("₸ 1 500", 1500.0),
+    ("KZT 1,500.00", 1500.0),
+    ("без суммы", 0.0),
+])
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == expected
+
+
+def test_publish_date_normalized():
+    t = Tender("1", published="2024-03-05T10:20:00+05:00")
+    assert t.published == datetime(2024, 3, 5, 5, 20)
+    assert t.publish_date == "2024-03-05T05:20:00"
+    assert t.raw_date == ""
+
+
+def test_publish_date_keeps_unparsed_text():
+    t = Tender("1", published=" до 5 марта ")
+    assert t.published is None
+    assert t.publish_date == "до 5 марта"
+    assert Tender.from_db((7, *t.db_row())).publish_date == "до 5 марта"
+
+
+def test_publish_date_missing():
+    assert Tender("1").publish_date == ""
+    assert Tender("1", published="").publish_date == ""
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("05.03.2024", datetime(2024, 3, 5)),
+    ("до 5 марта", "до 5 марта"),
+    ("  ", None),
+    (None, None),
+])
+def test_read_date(value, expected):
+    assert read_date(value) == expected
@@ -0,0 +1,125 @@
+import os
+import asyncio
+import tempfile
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+# bot читает настройки при импорте; база — во временном каталоге, а не database.db
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.mkdtemp(), "database.db"))
+
+import bot  # noqa: E402
+
+PATH = "/telegram/webhook"
+SECRET = "s3cret"
+
+
+def make_update(i):
+    return {"update_id": i, "message": {"message_id": i, "date": 0, "chat": {"id": i, "type": "private"}, "text": "hi"}}
+
+
+@pytest.fixture
+def webhook(monkeypatch):
+    # -> (функция запуска сценария, список обновлений, дошедших до диспетчера)
+    fed = []
+    monkeypatch.setattr(bot, "WEBHOOK_PATH", PATH)
+    monkeypatch.setattr(bot, "WEBHOOK_SECRET", SECRET)
+
+    def run(scenario, limit=2, feed=None):
+        monkeypatch.setattr(bot, "WEBHOOK_MAX_IN_FLIGHT", limit)
+
+        async def main():
+            async def record(_, update):
+                fed.append(update["update_id"])
+                if feed is not None:
+                    await feed(update)
+
+            monkeypatch.setattr(bot.dp, "feed_raw_update", record)
+            app = web.Application()
+            handler = bot.setup_webhook(app)
+            async with TestClient(TestServer(app)) as client:
+                await scenario(client, handler)
+                await asyncio.wait_for(asyncio.gather(*handler.tasks), 5)
+            return handler
+
+        return asyncio.run(main())
+
+    return run, fed
+
+
+def post(client, i, secret=SECRET):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret is not None else {}
+    return client.post(PATH, json=make_update(i), headers=headers)
+
+
+async def wait_until(condition, timeout=5):
+    async def poll():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_rejects_missing_or_wrong_secret(webhook):
+    run, fed = webhook
+    statuses = []
+
+    async def scenario(client, handler):
+        for i, secret in enumerate([None, "wrong", SECRET]):
+            async with post(client, i, secret) as r:
+                statuses.append(r.status)
+
+    run(scenario)
+    assert statuses == [401, 401, 200]
+    assert fed == [2]
+
+
+def test_caps_updates_in_flight(webhook):
+    run, fed = webhook
+    release = asyncio.Event()
+    peak = []
+    limit, total = 3, 10
+
+    async def feed(update):
+        peak.append(handler_ref[0].in_flight)
+        await release.wait()
+
+    handler_ref = []
+
+    async def scenario(client, handler):
+        handler_ref.append(handler)
+        requests = [asyncio.create_task(post(client, i)) for i in range(total)]
+        await wait_until(lambda: len(fed) == limit)
+        await asyncio.sleep(0.1)
+        # сверх лимита запросы ждут слота: ответа нет, до диспетчера не дошли
+        assert handler.in_flight == limit
+        assert len(fed) == limit
+        assert sum(r.done() for r in requests) == limit
+        release.set()
+        responses = await asyncio.gather(*requests)
+        assert [r.status for r in responses] == [200] * total
+        for r in responses:
+            r.release()
+
+    handler = run(scenario, limit=limit, feed=feed)
+    assert sorted(fed) == list(range(total))
+    assert max(peak) <= limit
+    assert handler.in_flight == 0
+
+
+def test_failed_update_frees_slot(webhook):
+    run, fed = webhook
+
+    async def feed(update):
+        raise RuntimeError("boom")
+
+    async def scenario(client, handler):
+        for i in range(3):
+            async with post(client, i) as r:
+                assert r.status == 200
+            await wait_until(lambda: handler.in_flight == 0)
+
+    handler = run(scenario, limit=1, feed=feed)
+    assert fed == [0, 1, 2]
+    assert handler.in_flight == 0
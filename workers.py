@@ -0,0 +1,213 @@
+# workers.py — сборщик, сопоставление и Telegram-фронт как отдельные процессы
+#
+#   python workers.py fetch   — опрашивает свою долю площадок (аренда в site_leases) и сохраняет тендеры
+#   python workers.py match   — сопоставляет новые тендеры с подписками, пишет outbox и обслуживает БД
+#   python workers.py front   — бот: команды, веб-сервер и отправка из outbox
+#
+# python bot.py по-прежнему запускает всё в одном процессе. Процессы общаются
+# только через SQLite: tenders, match_cursor, outbox и subscription_log.
+# Сборщиков можно запускать сколько угодно — площадки делятся между ними.
+# Метрики у каждого процесса свои, поэтому fetch и match отдают /metrics
+# на своём порту (METRICS_PORT), а сборщик там же — своё /schedule.
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from functools import partial
+
+import db
+import dedup
+import leases
+import maintenance
+import matching
+import metrics
+import scheduler
+import startup
+import storage
+import sync_state
+
+MATCH_IDLE_SECONDS = float(os.getenv("MATCH_IDLE_SECONDS", 2))  # как часто проверять новые тендеры
+FETCH_LIMIT = 50
+METRICS_PORTS = {"fetch": 10001, "match": 10002}  # по умолчанию; фронт отдаёт метрики на PORT
+
+INGESTED = asyncio.Event()  # будит match_loop, если он в том же процессе
+POLL_REQUESTED = asyncio.Event()  # будит fetch_loop после /parse в том же процессе
+
+
+# --- Сбор ---
+def _fetcher():
+    # fetcher тянет lxml и пул процессов разбора — импортируем к первому опросу, а не на старте
+    with startup.timed_import("fetcher"):
+        import fetcher
+    return fetcher
+
+
+async def close_fetcher():
+    # закрываем только то, что успели импортировать
+    if "fetcher" in sys.modules:
+        await sys.modules["fetcher"].close_session()
+    if "parsing" in sys.modules:
+        sys.modules["parsing"].shutdown()
+
+
+async def ingest(sites):
+    # опрос площадок и сохранение новых тендеров; -> список новых
+    fetcher = _fetcher()
+    with metrics.CYCLE_SECONDS.time():
+        results = await fetcher.fetch_sites(FETCH_LIMIT, sites)
+        scheduler.record(results)
+        added = await storage.run(db.save_new_tenders, fetcher.collect(results))
+        await storage.run(sync_state.commit)
+    logging.info(f"Dedup: {dedup.stats()}")
+    if added:
+        INGESTED.set()
+    return added
+
+
+async def request_poll():
+    # /parse: площадки опросит их арендатор — этот процесс или другой сборщик
+    await storage.run(leases.request_poll)
+    POLL_REQUESTED.set()
+
+
+async def fetch_loop(owner=None):
+    owner = owner or leases.worker_id()
+    held = set()
+    polled = None  # номер последнего учтённого /parse; запросы до старта не в счёт
+    try:
+        while True:
+            POLL_REQUESTED.clear()
+            try:
+                current = await storage.run(leases.rebalance, owner, scheduler.enabled_names())
+                if current != held:
+                    logging.info(f"Worker {owner} now polls {len(current)} sites")
+                    if current - held:
+                        # отметки новых площадок мог сдвинуть их прежний владелец
+                        await storage.run(sync_state.load)
+                    held = current
+                requested = await storage.run(leases.poll_requested)
+                if polled is not None and requested > polled:
+                    logging.info(f"Poll requested, polling {len(held)} held sites now")
+                    scheduler.force(held)
+                polled = requested
+                sites = scheduler.due(only=held)
+                if sites:
+                    logging.info(f"Polling sites: {', '.join(s['name'] for s in sites)}")
+                    await ingest(sites)
+            except Exception:
+                metrics.ERRORS.labels("cycle").inc()
+                logging.exception("Fetch loop error")
+            # просыпаемся и ради продления аренды, даже если опрашивать пока нечего
+            await scheduler.wait(only=held, at_most=leases.LEASE_RENEW_SECONDS, wakeup=POLL_REQUESTED)
+    finally:
+        leases.release(owner)
+
+
+# --- Сопоставление ---
+async def match_loop(on_queued=None):
+    while True:
+        INGESTED.clear()
+        processed = 0
+        try:
+            processed, queued = await storage.run(matching.match_new)
+            if queued and on_queued is not None:
+                on_queued()
+        except Exception:
+            metrics.ERRORS.labels("match").inc()
+            logging.exception("Match loop error")
+        if processed:
+            continue  # догоняем накопившееся без пауз
+        try:
+            await asyncio.wait_for(INGESTED.wait(), MATCH_IDLE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+# --- Обслуживание БД ---
+async def maintenance_loop():
+    # архив, чистка журналов и incremental vacuum; первый проход — через интервал после старта
+    while True:
+        await asyncio.sleep(maintenance.MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            await storage.run(maintenance.run)
+        except Exception:
+            metrics.ERRORS.labels("maintenance").inc()
+            logging.exception("Maintenance error")
+
+
+# --- Метрики процесса ---
+async def serve_metrics(role):
+    # -> AppRunner или None, если порт занят (например, второй сборщик на той же машине)
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(body=metrics.render().encode("utf-8"), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def handle_schedule(request):
+        return web.json_response(scheduler.snapshot(), dumps=partial(json.dumps, ensure_ascii=False))
+
+    port = int(os.getenv("METRICS_PORT", METRICS_PORTS[role]))
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    if role == "fetch":
+        app.router.add_get("/schedule", handle_schedule)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, "0.0.0.0", port).start()
+    except OSError:
+        logging.warning(f"Metrics listener could not bind port {port}")
+        await runner.cleanup()
+        return None
+    logging.info(f"Worker {role} serves /metrics on port {port}")
+    return runner
+
+
+# --- Точки входа ---
+async def run_fetch():
+    runner = await serve_metrics("fetch")
+    await storage.run(storage.create_tables)
+    await storage.run(db.load_seen_tenders)
+    await storage.run(sync_state.load)
+    try:
+        await asyncio.gather(fetch_loop(), metrics.watch_loop_lag())
+    finally:
+        await close_fetcher()
+        if runner is not None:
+            await runner.cleanup()
+
+
+async def run_match():
+    runner = await serve_metrics("match")
+    await storage.run(storage.create_tables)
+    await storage.run(db.load_subscriptions)
+    try:
+        await asyncio.gather(match_loop(), maintenance_loop(), metrics.watch_loop_lag())
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+
+async def run_front():
+    startup.listen_early(int(os.getenv("PORT", 10000)))  # health check отвечает, пока грузится aiogram
+    import bot  # требует BOT_TOKEN, поэтому только во фронте
+    await bot.main(roles=("front",))
+
+
+ROLES = {"fetch": run_fetch, "match": run_match, "front": run_front}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TenderuBot worker processes")
+    parser.add_argument("role", choices=sorted(ROLES))
+    args = parser.parse_args()
+    try:
+        asyncio.run(ROLES[args.role]())
+    except KeyboardInterrupt:
+        logging.info(f"Worker {args.role} stopped.")
+
+
+if __name__ == "__main__":
+    main()